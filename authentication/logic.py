@@ -6,11 +6,12 @@ import jwt
 from utils.config import AUTH_SECRET
 
 
-async def get_payload(uuid: UUID, roles: Iterable):
+async def get_payload(uuid: UUID, roles: Iterable, token_version: int = 0):
     payload = {
         'exp': (datetime.now() + timedelta(days=30)).timestamp(),
         'sub': str(uuid),
-        'roles': [str(role_uuid) for role_uuid in roles]
+        'roles': [str(role_uuid) for role_uuid in roles],
+        'ver': token_version
     }
     encoded_jwt = jwt.encode(payload, AUTH_SECRET, algorithm='HS256')
     payload.update({'access_token': encoded_jwt, 'token_type': 'Bearer'})
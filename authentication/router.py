@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from utils.logic import check_password
+from utils.passwords import check_password_async
 from utils.exceptions import exception_handler
 from utils.dependency import UsersServiceDep, UOWDep
 
@@ -18,12 +18,12 @@ router = APIRouter(prefix='/authentication', tags=['Authentication'])
 async def post_sign_in_handler(users_service: UsersServiceDep,
                                uow: UOWDep,
                                authentication: Authentication):
-    users = await users_service.get_users(uow, username=authentication.username, with_password=True)
-    if not users:
+    user = await users_service.get_user_by_username(uow, authentication.username, with_password=True)
+    if not user:
         raise UserNotFoundError
 
-    if not check_password(authentication.password, users[0].hashed_password):
+    if not await check_password_async(authentication.password, user.hashed_password):
         raise IncorrectCredentialsError
 
-    payload = await get_payload(users[0].uuid, users[0].roles)
+    payload = await get_payload(user.uuid, user.roles, user.token_version)
     return payload
@@ -1,6 +1,19 @@
 from pydantic import BaseModel
 
+from users.schemas import UserRead
+
 
 class Authentication(BaseModel):
     username: str
     password: str
+
+
+class Principal(BaseModel):
+    """
+    Author of the request with the permissions of all their roles.
+    """
+    user: UserRead
+    permissions: frozenset[str]
+
+    def has_permission(self, permission: str) -> bool:
+        return permission in self.permissions
@@ -1,30 +1,45 @@
+from uuid import UUID
+
 import jwt
 
 from users.repository import UsersRepository
 
 from utils.unitofwork import IUnitOfWork
+from utils.ttl_cache import TTLCache
 from utils.config import AUTH_SECRET
 
 
 class AuthenticationService:
-    def __init__(self, users_repository: UsersRepository):
+    def __init__(self, users_repository: UsersRepository, users_cache: TTLCache):
         self.users_repository = users_repository
+        # (uuid, token_version) -> пользователь; запись живёт недолго, поэтому отзыв токена доходит до всех воркеров
+        self.users_cache = users_cache
 
     async def authenticated_user(self, uow: IUnitOfWork, authorization: str | None):
-        async with uow:
-            if not authorization:
-                return
+        if not authorization:
+            return
 
-            token = authorization.split()
-            if len(token) <= 1:
-                return
+        token = authorization.split()
+        if len(token) <= 1:
+            return
 
-            token = token[1].strip()
-            payload = jwt.decode(token, AUTH_SECRET, algorithms=['HS256'])
-            uuid = payload['sub']
+        token = token[1].strip()
+        payload = jwt.decode(token, AUTH_SECRET, algorithms=['HS256'])
+        uuid = payload['sub']
 
-            if not uuid:
-                return
+        if not uuid:
+            return
 
-            user = await self.users_repository.find_one(uow.session, uuid=uuid)
+        # Токены, выданные до появления версий, соответствуют версии 0
+        key = (UUID(uuid), payload.get('ver', 0))
+        user = self.users_cache.get(key)
+        if user is not None:
             return user
+
+        async with uow:
+            user = await self.users_repository.find_one_with_token_version(uow.session, key[0])
+        if not user or user.token_version != key[1]:
+            return
+
+        self.users_cache.set(key, user)
+        return user
@@ -0,0 +1,67 @@
+"""
+Login flood benchmark: floods sign-in with concurrent requests and measures latency of a cheap route meanwhile.
+
+    python benchmarks/login_flood.py --url http://localhost:3000 --username admin --password secret
+
+Reports login throughput (including rejected 503 responses) and p50/p99 latency of the probe route.
+"""
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+
+from requests import Session
+
+
+def flood_logins(url: str, username: str, password: str, deadline: float) -> dict[int, int]:
+    statuses = dict()
+    with Session() as session:
+        while time.monotonic() < deadline:
+            res = session.post(f'{url}/api/v1/authentication', json={'username': username, 'password': password})
+            statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+    return statuses
+
+
+def probe(url: str, path: str, deadline: float) -> list[float]:
+    latencies = list()
+    with Session() as session:
+        while time.monotonic() < deadline:
+            started_at = time.perf_counter()
+            session.get(f'{url}{path}')
+            latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+
+def main():
+    parser = ArgumentParser(description='Login flood benchmark')
+    parser.add_argument('--url', default='http://localhost:3000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--login-clients', type=int, default=64)
+    parser.add_argument('--probe-clients', type=int, default=4)
+    parser.add_argument('--probe-path', default='/api/v1/version')
+    parser.add_argument('--duration', type=float, default=30)
+    args = parser.parse_args()
+
+    deadline = time.monotonic() + args.duration
+    with ThreadPoolExecutor(max_workers=args.login_clients + args.probe_clients) as executor:
+        logins = [executor.submit(flood_logins, args.url, args.username, args.password, deadline)
+                  for _ in range(args.login_clients)]
+        probes = [executor.submit(probe, args.url, args.probe_path, deadline) for _ in range(args.probe_clients)]
+
+        statuses = dict()
+        for future in logins:
+            for status, count in future.result().items():
+                statuses[status] = statuses.get(status, 0) + count
+        latencies = sorted(latency for future in probes for latency in future.result())
+
+    print(f'Login responses: {sum(statuses.values()) / args.duration:.1f} rps, by status: {statuses}')
+    print(f'Successful logins: {statuses.get(200, 0) / args.duration:.1f} rps')
+    if len(latencies) >= 2:
+        percentiles = quantiles(latencies, n=100)
+        print(f'{args.probe_path}: {len(latencies)} requests, '
+              f'p50 {percentiles[49] * 1000:.1f} ms, p99 {percentiles[98] * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,15 @@
 from uuid import UUID
 
 from fastapi import APIRouter
-from fastapi_cache.decorator import cache
-from fastapi_cache import FastAPICache
-
 from utils.exceptions import exception_handler
-from utils.logic import equal_uuids
-from utils.dependency import (AuthenticationServiceDep,
-                              InventoryServiceDep,
-                              RolesServiceDep,
+from utils.cache import cached, invalidate_tags
+from utils.logic import equal_uuids, validate_limit, DEFAULT_PAGE_LIMIT
+from utils.dependency import (InventoryServiceDep,
                               UsersServiceDep,
-                              AuthenticationDep,
+                              AuthorDep,
                               UOWDep)
 
 from users.exceptions import UserNotFoundError
-from authentication.exceptions import NotAuthenticatedError
 from records.logic import validate_price
 
 from inventory.schemas import InventoryItemCreate, InventoryItemUpdate
@@ -23,60 +18,60 @@ from inventory.exceptions import *
 router = APIRouter(prefix='/inventory', tags=['Inventory'])
 
 
+def get_inventory_items_tags(result, user_uuid: UUID | None = None, **kwargs):
+    # Инвентарь пользователя инвалидируется только изменениями его предметов, общий список - любыми
+    return [f'user-inventory:{user_uuid}' if user_uuid else 'inventory']
+
+
 @router.get('')
-@cache(namespace='inventory', expire=3600)
+@cached(namespace='inventory', expire=3600, tags=get_inventory_items_tags, per_principal=True)
 @exception_handler
 async def get_inventory_items_handler(uow: UOWDep,
-                                      authentication_service: AuthenticationServiceDep,
+                                      author: AuthorDep,
                                       inventory_service: InventoryServiceDep,
-                                      roles_service: RolesServiceDep,
                                       users_service: UsersServiceDep,
                                       user_uuid: UUID | None = None,
-                                      authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    if not user_uuid or not equal_uuids(author.uuid, user_uuid):
-        can_read = await roles_service.has_permission(uow, author, 'read_inventory')
+                                      limit: int = DEFAULT_PAGE_LIMIT,
+                                      cursor: str | None = None):
+    validate_limit(limit)
+    if not user_uuid or not equal_uuids(author.user.uuid, user_uuid):
+        can_read = author.has_permission('read_inventory')
         if not can_read:
             raise ReadInventoryDenied
 
-    if user_uuid and equal_uuids(author.uuid, user_uuid):
-        inventory_items = await inventory_service.get_inventory_items(uow, user_uuid=author.uuid)
+    if user_uuid and equal_uuids(author.user.uuid, user_uuid):
+        inventory_items, next_cursor = await inventory_service.get_inventory_items_page(uow, limit, cursor,
+                                                                                        user_uuid=author.user.uuid)
     elif user_uuid:
-        user = users_service.get_user(user_uuid)
+        user = await users_service.get_user(uow, user_uuid)
         if not user:
             raise UserNotFoundError
-        inventory_items = await inventory_service.get_inventory_items(uow, user_uuid=user.uuid)
+        inventory_items, next_cursor = await inventory_service.get_inventory_items_page(uow, limit, cursor,
+                                                                                        user_uuid=user.uuid)
     else:
-        inventory_items = await inventory_service.get_inventory_items(uow)
+        inventory_items, next_cursor = await inventory_service.get_inventory_items_page(uow, limit, cursor)
 
     return {
         'data': inventory_items,
+        'next_cursor': next_cursor,
         'detail': 'Inventory items were selected.'
     }
 
 
 @router.get('/{uuid}')
-@cache(namespace='inventory', expire=3600)
+@cached(namespace='inventory', expire=3600, tags=['user-inventory:{result[data].user_uuid}'],
+        per_principal=True)
 @exception_handler
 async def get_inventory_item_handler(uow: UOWDep,
-                                     authentication_service: AuthenticationServiceDep,
+                                     author: AuthorDep,
                                      inventory_service: InventoryServiceDep,
-                                     roles_service: RolesServiceDep,
-                                     uuid: UUID,
-                                     authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                                     uuid: UUID):
     inventory_item = await inventory_service.get_inventory_item(uow, uuid)
     if not inventory_item:
         raise InventoryItemNotFoundError
 
-    if not equal_uuids(author.uuid, inventory_item.user_uuid):
-        can_read = await roles_service.has_permission(uow, author, 'read_inventory')
+    if not equal_uuids(author.user.uuid, inventory_item.user_uuid):
+        can_read = author.has_permission('read_inventory')
         if not can_read:
             raise ReadInventoryDenied
 
@@ -89,27 +84,21 @@ async def get_inventory_item_handler(uow: UOWDep,
 @router.post('/')
 @exception_handler
 async def post_inventory_item_handler(uow: UOWDep,
-                                      authentication_service: AuthenticationServiceDep,
+                                      author: AuthorDep,
                                       inventory_service: InventoryServiceDep,
-                                      roles_service: RolesServiceDep,
                                       users_service: UsersServiceDep,
-                                      inventory_item: InventoryItemCreate,
-                                      authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    if not equal_uuids(author.uuid, inventory_item.user_uuid):
-        can_insert = await roles_service.has_permission(uow, author, 'insert_inventory')
+                                      inventory_item: InventoryItemCreate):
+    if not equal_uuids(author.user.uuid, inventory_item.user_uuid):
+        can_insert = author.has_permission('insert_inventory')
         if not can_insert:
             raise InsertInventoryDenied
 
-        user = users_service.get_user(uow, inventory_item.user_uuid)
+        user = await users_service.get_user(uow, inventory_item.user_uuid)
         if not user:
             raise UserNotFoundError
 
     await inventory_service.add_inventory_item(uow, inventory_item)
-    await FastAPICache.clear(namespace='inventory')
+    await invalidate_tags('inventory', f'user-inventory:{inventory_item.user_uuid}')
     return {
         'data': None,
         'detail': 'Inventory item was added.'
@@ -119,23 +108,17 @@ async def post_inventory_item_handler(uow: UOWDep,
 @router.put('/{uuid}')
 @exception_handler
 async def put_inventory_item_handler(uow: UOWDep,
-                                     authentication_service: AuthenticationServiceDep,
+                                     author: AuthorDep,
                                      inventory_service: InventoryServiceDep,
-                                     roles_service: RolesServiceDep,
-                                     users_service: RolesServiceDep,
+                                     users_service: UsersServiceDep,
                                      uuid: UUID,
-                                     inventory_item: InventoryItemUpdate,
-                                     authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    if not equal_uuids(author.uuid, inventory_item.user_uuid):
-        can_update = await roles_service.has_permission(uow, author, 'update_inventory')
+                                     inventory_item: InventoryItemUpdate):
+    if not equal_uuids(author.user.uuid, inventory_item.user_uuid):
+        can_update = author.has_permission('update_inventory')
         if not can_update:
             raise UpdateInventoryDenied
 
-        user = users_service.get_user(uow, inventory_item.user_uuid)
+        user = await users_service.get_user(uow, inventory_item.user_uuid)
         if not user:
             raise UserNotFoundError
 
@@ -146,7 +129,8 @@ async def put_inventory_item_handler(uow: UOWDep,
     validate_price(inventory_item.price)
 
     await inventory_service.update_inventory_item(uow, uuid, inventory_item)
-    await FastAPICache.clear(namespace='inventory')
+    await invalidate_tags('inventory', f'user-inventory:{item_with_this_uuid.user_uuid}',
+                          f'user-inventory:{inventory_item.user_uuid}')
     return {
         'data': None,
         'detail': 'Inventory item was updated.'
@@ -156,26 +140,20 @@ async def put_inventory_item_handler(uow: UOWDep,
 @router.delete('/{uuid}')
 @exception_handler
 async def delete_inventory_item_handler(uow: UOWDep,
-                                        authentication_service: AuthenticationServiceDep,
+                                        author: AuthorDep,
                                         inventory_service: InventoryServiceDep,
-                                        roles_service: RolesServiceDep,
-                                        uuid: UUID,
-                                        authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                                        uuid: UUID):
     item_with_this_uuid = await inventory_service.get_inventory_item(uow, uuid)
     if not item_with_this_uuid:
         raise InventoryItemNotFoundError
 
-    if not equal_uuids(author.uuid, item_with_this_uuid.user_uuid):
-        can_delete = await roles_service.has_permission(uow, author, 'delete_inventory')
+    if not equal_uuids(author.user.uuid, item_with_this_uuid.user_uuid):
+        can_delete = author.has_permission('delete_inventory')
         if not can_delete:
             raise DeleteInventoryDenied
 
     await inventory_service.delete_inventory_item(uow, uuid)
-    await FastAPICache.clear(namespace='inventory')
+    await invalidate_tags('inventory', f'user-inventory:{item_with_this_uuid.user_uuid}')
     return {
         'data': None,
         'detail': 'Inventory item was deleted.'
@@ -16,6 +16,14 @@ class InventoryService:
             inventory_items = await self.inventory_repository.find_all(uow.session, **filter_by_dict)
             return inventory_items
 
+    async def get_inventory_items_page(self, uow: IUnitOfWork, limit: int, cursor: str | None = None,
+                                       user_uuid: UUID | None = None):
+        filter_by_dict = {'user_uuid': user_uuid} if user_uuid else {}
+        async with uow:
+            inventory_items, next_cursor = await self.inventory_repository.find_page(uow.session, limit, cursor,
+                                                                                     **filter_by_dict)
+            return inventory_items, next_cursor
+
     async def get_inventory_item(self, uow: IUnitOfWork, uuid: UUID):
         async with uow:
             inventory_item = await self.inventory_repository.find_one(uow.session, uuid=uuid)
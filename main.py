@@ -1,14 +1,18 @@
-from pathlib import Path
-from fastapi import FastAPI
+import asyncio
+from typing import Annotated
+
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
-from redis import asyncio as aioredis
-import alembic.config
-import alembic.command
+from fastapi.responses import JSONResponse
 
-from utils.config import REDIS_HOST, REDIS_PORT, VERSION, DB_URL
+from utils.config import VERSION, READINESS_TIMEOUT
+from utils.redis import redis
+from utils.database import get_pool_stats, warm_up_pool, check_database
+from utils.instrumentation import sql_instrumentation_middleware, get_sql_stats
+from utils.dependency import roles_service, Requires
+from utils.exceptions import ReadMetricsDenied
 
+from authentication.schemas import Principal
 from authentication.router import router as authentication_router
 from users.router import router as users_router
 from records.router import router as records_router
@@ -17,6 +21,7 @@ from inventory.router import router as inventory_router
 from roles.router import router as roles_router
 from rarities.router import router as rarities_router
 from orders.router import router as orders_router
+from records.partitions import maintain_partitions
 
 app = FastAPI(
     title='TradeOverseer API',
@@ -33,6 +38,9 @@ app.add_middleware(
     allow_methods=['*'],
     allow_headers=['*']
 )
+app.middleware('http')(sql_instrumentation_middleware)
+
+ReadMetricsDep = Annotated[Principal, Depends(Requires('read_metrics', ReadMetricsDenied))]
 
 
 @app.get(f'/', tags=['Setup'])
@@ -45,6 +53,20 @@ async def get_root_handler():
 
 @app.get('/readyz', tags=['Setup'])
 async def get_readyz_handler():
+    # Воркер готов принимать трафик, только когда база (с прогретым пулом) и Redis отвечают
+    checks = dict()
+    for name, check in (('database', check_database), ('redis', redis.ping)):
+        try:
+            await asyncio.wait_for(check(), READINESS_TIMEOUT)
+            checks[name] = 'ok'
+        except Exception as e:
+            checks[name] = str(e) or type(e).__name__
+
+    if any(result != 'ok' for result in checks.values()):
+        return JSONResponse(status_code=503, content={
+            'data': checks,
+            'detail': 'API is not ready.'
+        })
     return {
         'data': 'Ready',
         'detail': 'API is ready.'
@@ -59,6 +81,22 @@ async def get_healthz_handler():
     }
 
 
+@app.get('/metrics/pool', tags=['Setup'])
+async def get_pool_metrics_handler(author: ReadMetricsDep):
+    return {
+        'data': get_pool_stats(),
+        'detail': 'Pool statistics were selected.'
+    }
+
+
+@app.get('/metrics/sql', tags=['Setup'])
+async def get_sql_metrics_handler(author: ReadMetricsDep):
+    return {
+        'data': get_sql_stats(),
+        'detail': 'SQL statistics were selected.'
+    }
+
+
 @app.get('/api/v1/version', tags=['Setup'])
 async def get_version_handler():
     return {
@@ -79,20 +117,21 @@ app.include_router(orders_router, prefix='/api/v1')
 
 @app.on_event('startup')
 async def startup_event():
-    # Redis
-    try:
-        redis = aioredis.from_url(f'redis://{REDIS_HOST}:{REDIS_PORT}', encoding='utf8', decode_responses=False)
-        FastAPICache.init(RedisBackend(redis), prefix='tradeoverseer-api-cache')
-        print('Redis Connected.')
-    except Exception as e:
-        print('Redis Connection Error:', e)
+    # Инвалидация индекса прав при изменении ролей в других воркерах
+    app.state.permission_listener = asyncio.create_task(roles_service.permission_index.listen())
 
-    # Alembic
+    # Секции записей создаются заранее, пока приложение работает (см. также records.commands create-partitions)
+    app.state.partitions_task = asyncio.create_task(maintain_partitions())
+
+    # Database (миграции применяются отдельной командой: python migrate.py)
     try:
-        alembic_ini_path = Path(__file__).parent / 'migrations' / 'alembic.ini'
-        alembic_config = alembic.config.Config(str(alembic_ini_path))
-        alembic_config.set_main_option('sqlalchemy.url', f'{DB_URL}?async_fallback=True')
-        alembic.command.upgrade(alembic_config, 'head')
-        print('Alembic Revision Upgraded.')
+        await asyncio.wait_for(warm_up_pool(), READINESS_TIMEOUT)
+        print('Database Pool Warmed Up.')
     except Exception as e:
-        print('Alembic Revision Upgrade Error:', e)
+        print('Database Pool Warm Up Error:', e)
+
+
+@app.on_event('shutdown')
+async def shutdown_event():
+    app.state.permission_listener.cancel()
+    app.state.partitions_task.cancel()
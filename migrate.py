@@ -0,0 +1,26 @@
+"""
+One-shot command that upgrades the database schema, e.g. as a release job before new workers start:
+
+    python migrate.py [revision]
+"""
+import sys
+from pathlib import Path
+
+import alembic.config
+import alembic.command
+
+from utils.config import DB_URL
+
+
+def main():
+    revision = sys.argv[1] if len(sys.argv) > 1 else 'head'
+
+    alembic_ini_path = Path(__file__).parent / 'migrations' / 'alembic.ini'
+    alembic_config = alembic.config.Config(str(alembic_ini_path))
+    alembic_config.set_main_option('sqlalchemy.url', f'{DB_URL}?async_fallback=True')
+    alembic.command.upgrade(alembic_config, revision)
+    print('Alembic Revision Upgraded.')
+
+
+if __name__ == '__main__':
+    main()
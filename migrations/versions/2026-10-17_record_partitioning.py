@@ -0,0 +1,104 @@
+"""record partitioning
+
+Revision ID: c92d28e0b39d
+Revises: 3048ab678069
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from records.partitions import next_month, partition_months, create_partition_sql, create_default_partition_sql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c92d28e0b39d'
+down_revision: Union[str, None] = '3048ab678069'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RECORD_INDEXES = {
+    'ix_record_skin_uuid_registered_at': None,
+    'ix_record_year_skin_uuid_registered_at': '(labels & 1) <> 0',
+    'ix_record_month_skin_uuid_registered_at': '(labels & 2) <> 0',
+    'ix_record_day_skin_uuid_registered_at': '(labels & 4) <> 0'
+}
+
+RECORD_COLUMNS = 'uuid, registered_at, skin_uuid, price, count, labels'
+
+
+def upgrade() -> None:
+    # Перенос идёт в одной транзакции миграции: таблица record заблокирована (ACCESS EXCLUSIVE)
+    # до конца копирования, поэтому запись в неё недоступна на всё время миграции.
+    # На большой таблице миграцию нужно запускать в окно обслуживания.
+    # Старая таблица переименовывается вместе с индексами, чтобы освободить имена для секционированной
+    op.execute('ALTER TABLE record RENAME TO record_unpartitioned')
+    op.execute('ALTER INDEX record_pkey RENAME TO record_unpartitioned_pkey')
+    for name in RECORD_INDEXES:
+        op.drop_index(name, 'record_unpartitioned', if_exists=True)
+
+    op.execute('''
+        CREATE TABLE record (
+            uuid UUID NOT NULL,
+            registered_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            skin_uuid UUID REFERENCES skin (uuid),
+            price NUMERIC NOT NULL,
+            count INTEGER NOT NULL,
+            labels SMALLINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (uuid, registered_at)
+        ) PARTITION BY RANGE (registered_at)
+    ''')
+    for name, where in RECORD_INDEXES.items():
+        op.create_index(name, 'record', ['skin_uuid', 'registered_at'],
+                        postgresql_where=sa.text(where) if where else None)
+
+    connection = op.get_bind()
+    first = connection.execute(sa.text('SELECT min(registered_at) FROM record_unpartitioned')).scalar()
+    months = partition_months(start=first)
+    for month in months:
+        op.execute(create_partition_sql(month))
+    # Записи за месяцы без секции попадают в секцию по умолчанию, а не ломают вставку
+    op.execute(create_default_partition_sql())
+
+    # Переносим данные по месяцу, чтобы каждый INSERT попадал ровно в одну секцию
+    for month in months:
+        op.execute(sa.text(f'''
+            INSERT INTO record ({RECORD_COLUMNS})
+            SELECT {RECORD_COLUMNS} FROM record_unpartitioned
+            WHERE registered_at >= :start AND registered_at < :end
+        ''').bindparams(start=month, end=next_month(month)))
+    # У записей без времени регистрации нет секции, они попадают в самую старую
+    op.execute(sa.text(f'''
+        INSERT INTO record ({RECORD_COLUMNS})
+        SELECT uuid, :first, skin_uuid, price, count, labels FROM record_unpartitioned
+        WHERE registered_at IS NULL
+    ''').bindparams(first=months[0]))
+
+    op.drop_table('record_unpartitioned')
+
+
+def downgrade() -> None:
+    op.execute('ALTER TABLE record RENAME TO record_partitioned')
+    op.execute('ALTER INDEX record_pkey RENAME TO record_partitioned_pkey')
+    for name in RECORD_INDEXES:
+        op.drop_index(name, 'record_partitioned', if_exists=True)
+
+    op.execute('''
+        CREATE TABLE record (
+            uuid UUID NOT NULL PRIMARY KEY,
+            registered_at TIMESTAMP WITHOUT TIME ZONE,
+            skin_uuid UUID REFERENCES skin (uuid),
+            price NUMERIC NOT NULL,
+            count INTEGER NOT NULL,
+            labels SMALLINT NOT NULL DEFAULT 0
+        )
+    ''')
+    op.execute(f'INSERT INTO record ({RECORD_COLUMNS}) SELECT {RECORD_COLUMNS} FROM record_partitioned')
+    for name, where in RECORD_INDEXES.items():
+        op.create_index(name, 'record', ['skin_uuid', 'registered_at'],
+                        postgresql_where=sa.text(where) if where else None)
+
+    # Секции удаляются вместе с секционированной таблицей
+    op.drop_table('record_partitioned')
@@ -0,0 +1,48 @@
+"""record rollups
+
+Revision ID: 3048ab678069
+Revises: fc8464f22ce3
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3048ab678069'
+down_revision: Union[str, None] = 'fc8464f22ce3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ROLLUP_TABLES = ['record_rollup_hour', 'record_rollup_day']
+
+
+def upgrade() -> None:
+    # Таблицы заполняются при вставке записей, историю нужно пересчитать командой
+    # python -m records.commands rebuild-rollups
+    for table in ROLLUP_TABLES:
+        op.create_table(
+            table,
+            sa.Column('skin_uuid', sa.Uuid(), sa.ForeignKey('skin.uuid'), nullable=False),
+            sa.Column('started_at', sa.TIMESTAMP(), nullable=False),
+            sa.Column('first_price', sa.Numeric(), nullable=False),
+            sa.Column('last_price', sa.Numeric(), nullable=False),
+            sa.Column('min_price', sa.Numeric(), nullable=False),
+            sa.Column('max_price', sa.Numeric(), nullable=False),
+            sa.Column('sum_price', sa.Numeric(), nullable=False),
+            sa.Column('min_count', sa.Integer(), nullable=False),
+            sa.Column('max_count', sa.Integer(), nullable=False),
+            sa.Column('last_count', sa.Integer(), nullable=False),
+            sa.Column('samples', sa.Integer(), nullable=False),
+            sa.Column('first_registered_at', sa.TIMESTAMP(), nullable=False),
+            sa.Column('last_registered_at', sa.TIMESTAMP(), nullable=False),
+            sa.PrimaryKeyConstraint('skin_uuid', 'started_at')
+        )
+
+
+def downgrade() -> None:
+    for table in ROLLUP_TABLES:
+        op.drop_table(table)
@@ -0,0 +1,114 @@
+"""records numeric prices and label mask
+
+Revision ID: fc8464f22ce3
+Revises:
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fc8464f22ce3'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_CHUNK_SIZE = 10000
+
+LABEL_INDEXES = {
+    'ix_record_year_skin_uuid_registered_at': 1,
+    'ix_record_month_skin_uuid_registered_at': 2,
+    'ix_record_day_skin_uuid_registered_at': 4
+}
+
+
+def upgrade() -> None:
+    # Миграция может быть прервана после любого шага, поэтому каждый шаг проверяет, не выполнен ли он уже
+    columns = {column['name']: column['type'] for column in sa.inspect(op.get_bind()).get_columns('record')}
+    if not isinstance(columns['price'], sa.Numeric):
+        _convert_record_columns()
+
+    columns = {column['name']: column['type'] for column in sa.inspect(op.get_bind()).get_columns('realtime_record')}
+    if not isinstance(columns['last_price'], sa.Numeric):
+        op.alter_column('realtime_record', 'previous_price', type_=sa.Numeric(),
+                        postgresql_using="replace(previous_price, ',', '.')::numeric")
+        op.alter_column('realtime_record', 'last_price', type_=sa.Numeric(),
+                        postgresql_using="replace(last_price, ',', '.')::numeric")
+
+    with op.get_context().autocommit_block():
+        _drop_invalid_index('ix_record_skin_uuid_registered_at')
+        op.create_index('ix_record_skin_uuid_registered_at', 'record', ['skin_uuid', 'registered_at'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        for name, bit in LABEL_INDEXES.items():
+            _drop_invalid_index(name)
+            op.create_index(name, 'record', ['skin_uuid', 'registered_at'],
+                            postgresql_where=sa.text(f'(labels & {bit}) <> 0'),
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def _drop_invalid_index(name: str):
+    # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс, который if_not_exists не пересоздаст
+    connection = op.get_bind()
+    invalid = connection.execute(sa.text('''
+        SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+        WHERE pg_class.relname = :name AND NOT pg_index.indisvalid
+    '''), {'name': name}).scalar()
+    if invalid:
+        connection.execute(sa.text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+
+
+def _convert_record_columns():
+    # Новые колонки заполняются порциями по первичному ключу, каждая порция коммитится отдельно.
+    # Если миграция прервётся, повторный запуск пройдёт таблицу заново, обновляя только незаполненные строки.
+    op.execute('ALTER TABLE record ADD COLUMN IF NOT EXISTS price_numeric NUMERIC, '
+               'ADD COLUMN IF NOT EXISTS labels_mask SMALLINT')
+
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last_uuid = None
+        while True:
+            after = 'WHERE uuid > :last_uuid' if last_uuid is not None else ''
+            upper_uuid = connection.execute(sa.text(f'''
+                SELECT max(uuid) FROM (SELECT uuid FROM record {after} ORDER BY uuid LIMIT :chunk_size) AS chunk
+            '''), {'last_uuid': last_uuid, 'chunk_size': BACKFILL_CHUNK_SIZE}).scalar()
+            if upper_uuid is None:
+                break
+
+            lower = 'AND uuid > :last_uuid' if last_uuid is not None else ''
+            connection.execute(sa.text(f'''
+                UPDATE record SET
+                    price_numeric = replace(price, ',', '.')::numeric,
+                    labels_mask = (CASE WHEN labels LIKE '%"year"%' THEN 1 ELSE 0 END)
+                                | (CASE WHEN labels LIKE '%"month"%' THEN 2 ELSE 0 END)
+                                | (CASE WHEN labels LIKE '%"day"%' THEN 4 ELSE 0 END)
+                WHERE uuid <= :upper_uuid {lower} AND labels_mask IS NULL
+            '''), {'last_uuid': last_uuid, 'upper_uuid': upper_uuid})
+            last_uuid = upper_uuid
+
+    op.execute('ALTER TABLE record DROP COLUMN price, DROP COLUMN labels')
+    op.alter_column('record', 'price_numeric', new_column_name='price', nullable=False)
+    op.alter_column('record', 'labels_mask', new_column_name='labels', nullable=False, server_default='0')
+
+
+def downgrade() -> None:
+    for name in LABEL_INDEXES:
+        op.drop_index(name, 'record', if_exists=True)
+    op.drop_index('ix_record_skin_uuid_registered_at', 'record', if_exists=True)
+
+    op.alter_column('realtime_record', 'last_price', type_=sa.String(), postgresql_using='last_price::varchar')
+    op.alter_column('realtime_record', 'previous_price', type_=sa.String(),
+                    postgresql_using='previous_price::varchar')
+
+    op.alter_column('record', 'labels', server_default=None)
+    op.alter_column('record', 'labels', type_=sa.String(), postgresql_using='''
+        to_json(array_remove(ARRAY[
+            CASE WHEN labels & 1 <> 0 THEN 'year' END,
+            CASE WHEN labels & 2 <> 0 THEN 'month' END,
+            CASE WHEN labels & 4 <> 0 THEN 'day' END
+        ], NULL))::varchar
+    ''')
+    op.alter_column('record', 'price', type_=sa.String(), postgresql_using='price::varchar')
@@ -0,0 +1,27 @@
+"""user token version
+
+Revision ID: a7d2e94b1c3f
+Revises: c92d28e0b39d
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d2e94b1c3f'
+down_revision: Union[str, None] = 'c92d28e0b39d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Значение по умолчанию совпадает с версией в токенах, выданных до миграции
+    op.add_column('user', sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('user', 'token_version')
@@ -0,0 +1,46 @@
+"""user username unique index
+
+Revision ID: 5e1b0c7d9a24
+Revises: a7d2e94b1c3f
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1b0c7d9a24'
+down_revision: Union[str, None] = 'a7d2e94b1c3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT username FROM "user" GROUP BY username HAVING count(*) > 1 LIMIT 10'
+    )).scalars().all()
+    if duplicates:
+        raise RuntimeError(f'Usernames are not unique, rename the users first: {", ".join(duplicates)}')
+
+    with op.get_context().autocommit_block():
+        _drop_invalid_index('ix_user_username')
+        op.create_index('ix_user_username', 'user', ['username'], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def _drop_invalid_index(name: str):
+    # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс, который if_not_exists не пересоздаст
+    connection = op.get_bind()
+    invalid = connection.execute(sa.text('''
+        SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+        WHERE pg_class.relname = :name AND NOT pg_index.indisvalid
+    '''), {'name': name}).scalar()
+    if invalid:
+        connection.execute(sa.text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_username', 'user', if_exists=True)
@@ -1,6 +1,4 @@
-from requests import get
 from datetime import datetime
-from pytz import timezone
 
 from utils.config import ORDERS_NOTIFICATION_CHATS, ORDERS_NOTIFICATION_BOT_TOKEN
 
@@ -12,6 +10,10 @@ class OrdersService:
         pass
 
     async def add_order(self, order: Order):
+        # Тяжёлые модули нужны только здесь, поэтому не замедляют запуск воркера
+        from requests import get
+        from pytz import timezone
+
         now = datetime.now(tz=timezone("Europe/Moscow")).strftime("%d/%m/%Y, %H:%M:%S")
         msg = (f'Новое обращение ({now})\n'
                f'Подписка: {order.selected}\n'
@@ -1,41 +1,33 @@
+from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter
-from fastapi_cache.decorator import cache
-from fastapi_cache import FastAPICache
-
+from fastapi import APIRouter, Depends
 from utils.exceptions import exception_handler
+from utils.cache import cached, invalidate_tags
 from utils.dependency import (RaritiesServiceDep,
-                              AuthenticationDep,
-                              RolesServiceDep,
-                              UOWDep,
-                              AuthenticationServiceDep)
+                              Requires,
+                              UOWDep)
 
-from authentication.exceptions import NotAuthenticatedError
+from authentication.schemas import Principal
 
 from rarities.exceptions import *
 from rarities.schemas import RarityCreate, RarityUpdate
 
 router = APIRouter(prefix='/rarities', tags=['Rarities'])
 
+ReadRaritiesDep = Annotated[Principal, Depends(Requires('read_rarities', ReadRarityDenied))]
+InsertRaritiesDep = Annotated[Principal, Depends(Requires('insert_rarities', InsertRarityDenied))]
+UpdateRaritiesDep = Annotated[Principal, Depends(Requires('update_rarities', UpdateRarityDenied))]
+DeleteRaritiesDep = Annotated[Principal, Depends(Requires('delete_rarities', DeleteRarityDenied))]
+
 
 @router.get('')
-@cache(namespace='rarities', expire=3600)
+@cached(namespace='rarities', expire=3600, tags=['rarities'])
 @exception_handler
 async def get_rarities_handler(rarities_service: RaritiesServiceDep,
-                               authentication_service: AuthenticationServiceDep,
-                               roles_service: RolesServiceDep,
                                uow: UOWDep,
-                               name: str | None = None,
-                               authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_read = await roles_service.has_permission(uow, author, 'read_rarities')
-    if not can_read:
-        raise ReadRarityDenied
-
+                               author: ReadRaritiesDep,
+                               name: str | None = None):
     rarities = await rarities_service.get_rarities(uow, name=name)
     return {
         'data': rarities,
@@ -44,22 +36,12 @@ async def get_rarities_handler(rarities_service: RaritiesServiceDep,
 
 
 @router.get('/{uuid}')
-@cache(namespace='rarities', expire=3600)
+@cached(namespace='rarities', expire=3600, tags=['rarity:{uuid}'])
 @exception_handler
 async def get_rarity_handler(rarities_service: RaritiesServiceDep,
-                             authentication_service: AuthenticationServiceDep,
-                             roles_service: RolesServiceDep,
                              uow: UOWDep,
-                             uuid: UUID,
-                             authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_read = await roles_service.has_permission(uow, author, 'read_rarities')
-    if not can_read:
-        raise ReadRarityDenied
-
+                             author: ReadRaritiesDep,
+                             uuid: UUID):
     rarity = await rarities_service.get_rarity(uow, uuid)
     if not rarity:
         raise RarityNotFoundError
@@ -73,22 +55,11 @@ async def get_rarity_handler(rarities_service: RaritiesServiceDep,
 @router.post('/')
 @exception_handler
 async def post_rarity_handler(uow: UOWDep,
-                              authentication_service: AuthenticationServiceDep,
-                              roles_service: RolesServiceDep,
+                              author: InsertRaritiesDep,
                               rarities_service: RaritiesServiceDep,
-                              rarity: RarityCreate,
-                              authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_insert = await roles_service.has_permission(uow, author, 'insert_rarities')
-    if not can_insert:
-        raise InsertRarityDenied
-
+                              rarity: RarityCreate):
     await rarities_service.add_rarity(uow, rarity)
-    await FastAPICache.clear(namespace='rarities')
-    await FastAPICache.clear(namespace='skins')
+    await invalidate_tags('rarities')
     return {
         'data': None,
         'detail': 'Rarity was added.'
@@ -98,27 +69,16 @@ async def post_rarity_handler(uow: UOWDep,
 @router.put('/{uuid}')
 @exception_handler
 async def put_rarity_handler(uow: UOWDep,
-                             authentication_service: AuthenticationServiceDep,
-                             roles_service: RolesServiceDep,
+                             author: UpdateRaritiesDep,
                              rarities_service: RaritiesServiceDep,
                              uuid: UUID,
-                             rarity: RarityUpdate,
-                             authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                             rarity: RarityUpdate):
     rarity_with_this_uuid = await rarities_service.get_rarity(uow, uuid)
     if not rarity_with_this_uuid:
         raise RarityNotFoundError
 
-    can_update = await roles_service.has_permission(uow, author, 'update_rarities')
-    if not can_update:
-        raise UpdateRarityDenied
-
     await rarities_service.update_rarity(uow, uuid, rarity)
-    await FastAPICache.clear(namespace='rarities')
-    await FastAPICache.clear(namespace='skins')
+    await invalidate_tags('rarities', f'rarity:{uuid}')
     return {
         'data': None,
         'detail': 'Rarity was updated.'
@@ -128,26 +88,15 @@ async def put_rarity_handler(uow: UOWDep,
 @router.delete('/{uuid}')
 @exception_handler
 async def delete_rarity_handler(uow: UOWDep,
-                                authentication_service: AuthenticationServiceDep,
-                                roles_service: RolesServiceDep,
+                                author: DeleteRaritiesDep,
                                 rarities_service: RaritiesServiceDep,
-                                uuid: UUID,
-                                authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                                uuid: UUID):
     rarity_with_this_uuid = await rarities_service.get_rarity(uow, uuid)
     if not rarity_with_this_uuid:
         raise RarityNotFoundError
 
-    can_delete = await roles_service.has_permission(uow, author, 'delete_rarities')
-    if not can_delete:
-        raise DeleteRarityDenied
-
     await rarities_service.delete_rarity(uow, uuid)
-    await FastAPICache.clear(namespace='rarities')
-    await FastAPICache.clear(namespace='skins')
+    await invalidate_tags('rarities', f'rarity:{uuid}')
     return {
         'data': None,
         'detail': 'Rarity was deleted.'
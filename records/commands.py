@@ -0,0 +1,91 @@
+import asyncio
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from utils.database import async_session_maker
+
+from records.repository import HourRollupsRepository, DayRollupsRepository
+from records.logic import truncate
+from records.partitions import (MONTHS_AHEAD, months_between, month_start, partition_months, partition_name,
+                                detach_partition_sql, list_partitions_sql, ensure_partitions)
+
+
+async def rebuild_rollups(start: datetime, end: datetime):
+    """
+    Function that recomputes hour and day rollups from raw records, one day per transaction.
+    :param start: first day to rebuild
+    :param end: day after the last one to rebuild
+    """
+    repositories = [HourRollupsRepository(), DayRollupsRepository()]
+    day = truncate(start, 'day')
+    while day < end:
+        async with async_session_maker() as session:
+            for repository in repositories:
+                await repository.rebuild(session, day, day + timedelta(days=1))
+            await session.commit()
+        print(f'Rollups for {day.date()} were rebuilt.')
+        day += timedelta(days=1)
+
+
+async def create_partitions(months_ahead: int = MONTHS_AHEAD, start: datetime | None = None):
+    """
+    Function that creates monthly partitions of records up to the given number of months ahead.
+    :param months_ahead: how many months after the current one should have partitions
+    :param start: first month to create (the current month by default)
+    """
+    months = partition_months(months_ahead, start)
+    async with async_session_maker() as session:
+        await ensure_partitions(session, months)
+        await session.commit()
+    for month in months:
+        print(f'Partition {partition_name(month)} is ready.')
+
+
+async def detach_partitions(before: datetime, drop: bool = False):
+    """
+    Function that detaches (and optionally drops) partitions of months before the given one.
+    :param before: first month to keep
+    :param drop: drop detached partitions
+    """
+    async with async_session_maker() as session:
+        res = await session.execute(text(list_partitions_sql()))
+        partitions = set(res.scalars().all())
+        for month in months_between(datetime(2000, 1, 1), month_start(before)):
+            if partition_name(month) not in partitions:
+                continue
+            await session.execute(text(detach_partition_sql(month)))
+            if drop:
+                await session.execute(text(f'DROP TABLE {partition_name(month)}'))
+            print(f'Partition {partition_name(month)} was {"dropped" if drop else "detached"}.')
+        await session.commit()
+
+
+def main():
+    parser = ArgumentParser(description='Records maintenance commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild_rollups_parser = subparsers.add_parser('rebuild-rollups', help='Recompute hour and day rollups')
+    rebuild_rollups_parser.add_argument('--start', type=datetime.fromisoformat, required=True)
+    rebuild_rollups_parser.add_argument('--end', type=datetime.fromisoformat, default=datetime.now(tz=None))
+
+    create_partitions_parser = subparsers.add_parser('create-partitions', help='Create future monthly partitions')
+    create_partitions_parser.add_argument('--months-ahead', type=int, default=MONTHS_AHEAD)
+    create_partitions_parser.add_argument('--start', type=datetime.fromisoformat, default=None)
+
+    detach_partitions_parser = subparsers.add_parser('detach-partitions', help='Detach old monthly partitions')
+    detach_partitions_parser.add_argument('--before', type=datetime.fromisoformat, required=True)
+    detach_partitions_parser.add_argument('--drop', action='store_true')
+
+    args = parser.parse_args()
+    if args.command == 'rebuild-rollups':
+        asyncio.run(rebuild_rollups(args.start, args.end))
+    elif args.command == 'create-partitions':
+        asyncio.run(create_partitions(args.months_ahead, args.start))
+    elif args.command == 'detach-partitions':
+        asyncio.run(detach_partitions(args.before, args.drop))
+
+
+if __name__ == '__main__':
+    main()
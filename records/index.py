@@ -0,0 +1,140 @@
+from datetime import datetime
+from typing import Iterable
+from uuid import UUID
+
+from redis.exceptions import RedisError
+
+from utils.redis import redis
+
+from records.repository import RecordsRepository
+from records.logic import LABEL_INTERVALS, get_labels
+
+LABEL_INDEX_KEY = 'tradeoverseer-api-labels:{}'
+LABEL_INDEX_LOADED_FIELD = 'loaded'
+LABEL_INDEX_EXPIRE = 2 * 24 * 60 * 60
+
+# Атомарно проверяет и навешивает лейблы. Если индекс скина ещё не загружен, возвращает nil.
+CLAIM_LABELS_SCRIPT = '''
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local now = tonumber(ARGV[1])
+local claimed = {}
+for i = 3, #ARGV, 2 do
+    local last = redis.call('HGET', KEYS[1], ARGV[i])
+    if not last or tonumber(last) < now - tonumber(ARGV[i + 1]) then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[1])
+        table.insert(claimed, ARGV[i])
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return claimed
+'''
+
+# Загружает индекс скина из базы, не перезаписывая то, что уже успел навесить другой воркер
+LOAD_LABELS_SCRIPT = '''
+for i = 2, #ARGV, 2 do
+    redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+'''
+
+
+class LabelIndex:
+    """
+    Per-skin index of the last time each label was assigned.
+    The index lives in Redis so that all workers share it, with an in-process copy
+    used when Redis is unavailable. Missing entries are rebuilt from the database.
+    """
+
+    def __init__(self, records_repository: RecordsRepository):
+        self.records_repository = records_repository
+        self.local: dict[UUID, dict[str, datetime]] = dict()
+        self.claim_labels_script = redis.register_script(CLAIM_LABELS_SCRIPT)
+        self.load_labels_script = redis.register_script(LOAD_LABELS_SCRIPT)
+
+    async def claim(self, session, skin_uuid: UUID, registered_at: datetime) -> list[str]:
+        labels = await self.claim_many(session, [skin_uuid], registered_at)
+        return labels[skin_uuid]
+
+    async def claim_many(self, session, skin_uuids: Iterable[UUID], registered_at: datetime) -> dict[UUID, list[str]]:
+        """
+        Function that atomically assigns labels to new records of the given skins.
+        :param session: session used to rebuild missing entries from the database
+        :param skin_uuids: skins of the new records
+        :param registered_at: time of the new records
+        :return: dict {skin_uuid: labels}
+        """
+        skin_uuids = list(dict.fromkeys(skin_uuids))
+        try:
+            return await self._claim_many_shared(session, skin_uuids, registered_at)
+        except RedisError:
+            return await self._claim_many_local(session, skin_uuids, registered_at)
+
+    async def forget(self, skin_uuids: Iterable[UUID]):
+        """
+        Function that drops index entries, e.g. when records with claimed labels were not saved.
+        The entries are rebuilt from the database on the next claim.
+        """
+        skin_uuids = list(skin_uuids)
+        for skin_uuid in skin_uuids:
+            self.local.pop(skin_uuid, None)
+        try:
+            await redis.delete(*[LABEL_INDEX_KEY.format(skin_uuid) for skin_uuid in skin_uuids])
+        except RedisError:
+            pass
+
+    async def _claim_many_shared(self, session, skin_uuids: list[UUID], registered_at: datetime):
+        claimed = await self._run_claim_script(skin_uuids, registered_at)
+
+        cold_skin_uuids = [skin_uuid for skin_uuid in skin_uuids if claimed[skin_uuid] is None]
+        if cold_skin_uuids:
+            last_labeled = await self._load_from_db(session, cold_skin_uuids, registered_at)
+            async with redis.pipeline(transaction=False) as pipe:
+                for skin_uuid in cold_skin_uuids:
+                    args = [LABEL_INDEX_EXPIRE, LABEL_INDEX_LOADED_FIELD, 1]
+                    for label, last in last_labeled.get(skin_uuid, dict()).items():
+                        args.extend([label, last.timestamp()])
+                    await self.load_labels_script(keys=[LABEL_INDEX_KEY.format(skin_uuid)], args=args, client=pipe)
+                await pipe.execute()
+            claimed.update(await self._run_claim_script(cold_skin_uuids, registered_at))
+
+        labels = dict()
+        for skin_uuid in skin_uuids:
+            labels[skin_uuid] = [label.decode() for label in claimed[skin_uuid] or list()]
+            skin_local = self.local.setdefault(skin_uuid, dict())
+            for label in labels[skin_uuid]:
+                skin_local[label] = registered_at
+        return labels
+
+    async def _run_claim_script(self, skin_uuids: list[UUID], registered_at: datetime):
+        args = [registered_at.timestamp(), LABEL_INDEX_EXPIRE]
+        for label, interval in LABEL_INTERVALS.items():
+            args.extend([label, interval.total_seconds()])
+
+        async with redis.pipeline(transaction=False) as pipe:
+            for skin_uuid in skin_uuids:
+                await self.claim_labels_script(keys=[LABEL_INDEX_KEY.format(skin_uuid)], args=args, client=pipe)
+            res = await pipe.execute()
+        return dict(zip(skin_uuids, res))
+
+    async def _claim_many_local(self, session, skin_uuids: list[UUID], registered_at: datetime):
+        cold_skin_uuids = [skin_uuid for skin_uuid in skin_uuids if skin_uuid not in self.local]
+        if cold_skin_uuids:
+            last_labeled = await self._load_from_db(session, cold_skin_uuids, registered_at)
+            for skin_uuid in cold_skin_uuids:
+                # Пока шла загрузка, запись могла появиться из другого запроса этого воркера
+                self.local.setdefault(skin_uuid, last_labeled.get(skin_uuid, dict()))
+
+        labels = dict()
+        for skin_uuid in skin_uuids:
+            skin_local = self.local[skin_uuid]
+            labels[skin_uuid] = get_labels(registered_at, skin_local)
+            for label in labels[skin_uuid]:
+                skin_local[label] = registered_at
+        return labels
+
+    async def _load_from_db(self, session, skin_uuids: list[UUID], registered_at: datetime):
+        return await self.records_repository.find_last_labeled(session, skin_uuids,
+                                                               registered_at - max(LABEL_INTERVALS.values()))
@@ -0,0 +1,232 @@
+import asyncio
+import csv
+import json
+import os
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Iterator
+from uuid import UUID, uuid5, NAMESPACE_URL
+
+from redis.exceptions import RedisError
+from sqlalchemy import text
+
+from utils.database import async_session_maker
+from utils.redis import redis
+
+from skins.repository import SkinsRepository
+
+from records.repository import RecordsRepository, RealtimeRecordsRepository
+from records.index import LabelIndex
+from records.service import REALTIME_VERSION_KEY
+from records.commands import rebuild_rollups
+from records.logic import (LABEL_INTERVALS, validate_price, validate_count, get_labels, labels_to_mask, truncate)
+from records.partitions import PARTITIONED_TABLE, months_between, ensure_partitions
+
+INPUT_FORMATS = ['ndjson', 'csv']
+COPY_COLUMNS = ['uuid', 'registered_at', 'skin_uuid', 'price', 'count', 'labels']
+STAGING_TABLE = 'record_load_staging'
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def read_rows(path: str, input_format: str) -> Iterator[dict | str]:
+    # Строки NDJSON разбираются в load_chunk, чтобы битая строка отклонялась, а не прерывала загрузку
+    with open(path, newline='', encoding='utf8') as file:
+        if input_format == 'csv':
+            yield from csv.DictReader(file)
+            return
+        for line in file:
+            if line.strip():
+                yield line
+
+
+def parse_row(row: dict | str, default_uuid: UUID) -> tuple:
+    """
+    Function that validates an input row and converts it to COPY values (without labels).
+    :param row: dict (or NDJSON line) with skin_uuid, price, count, registered_at and optional uuid
+    :param default_uuid: uuid of the record if the row has none
+    :return: (uuid, registered_at, skin_uuid, price, count)
+    """
+    if isinstance(row, str):
+        row = json.loads(row)
+    registered_at = datetime.fromisoformat(row['registered_at'])
+    if registered_at.tzinfo is not None:
+        # В базе время хранится без часового пояса, как его пишет add_record
+        registered_at = registered_at.astimezone().replace(tzinfo=None)
+
+    count = int(row['count'])
+    validate_count(count)
+    return (UUID(row['uuid']) if row.get('uuid') else default_uuid,
+            registered_at,
+            UUID(row['skin_uuid']),
+            Decimal(validate_price(str(row['price']))),
+            count)
+
+
+def load_checkpoint(path: str) -> dict:
+    state = {
+        'offset': 0,
+        'loaded': 0,
+        'rejected': 0,
+        'start': None,
+        'end': None,
+        'skins': dict(),
+        'finished': False
+    }
+    if os.path.exists(path):
+        with open(path, encoding='utf8') as file:
+            state.update(json.load(file))
+    return state
+
+
+def save_checkpoint(path: str, state: dict):
+    # Файл заменяется атомарно, чтобы прерванная запись не испортила предыдущий чекпоинт
+    with open(f'{path}.tmp', 'w', encoding='utf8') as file:
+        json.dump(state, file)
+    os.replace(f'{path}.tmp', path)
+
+
+class RecordsLoader:
+    """
+    Bulk loader of historical records.
+    Labels are computed in one sequential pass, so rows of each skin should be ordered by registered_at.
+    Rows are written with COPY in chunks, after every chunk the progress is saved to the checkpoint file.
+    A chunk is copied into a staging table and inserted with ON CONFLICT DO NOTHING, and records without
+    uuid get one derived from the file and the line, so a chunk repeated after a crash is not duplicated.
+    """
+
+    def __init__(self, checkpoint_path: str):
+        self.checkpoint_path = checkpoint_path
+        self.state = load_checkpoint(checkpoint_path)
+        self.records_repository = RecordsRepository()
+        self.skins_repository = SkinsRepository()
+        # skin_uuid -> {label: время последней записи с этим лейблом}
+        self.last_labeled: dict[UUID, dict[str, datetime]] = {
+            UUID(skin_uuid): {label: datetime.fromisoformat(last) for label, last in labels.items()}
+            for skin_uuid, labels in self.state['skins'].items()
+        }
+        self.missing_skins: set[UUID] = set()
+        self.source_uuid: UUID | None = None
+
+    async def load(self, path: str, input_format: str, chunk_size: int):
+        if self.state['finished']:
+            print(f'{path} was already loaded, remove {self.checkpoint_path} to load it again.')
+            return
+
+        self.source_uuid = uuid5(NAMESPACE_URL, os.path.abspath(path))
+        rows = islice(enumerate(read_rows(path, input_format)), self.state['offset'], None)
+        while chunk := list(islice(rows, chunk_size)):
+            await self.load_chunk(chunk)
+            print(f'Loaded {self.state["loaded"]} records, rejected {self.state["rejected"]}.')
+
+        await self.finish()
+
+    async def load_chunk(self, chunk: list[tuple[int, dict | str]]):
+        parsed = list()
+        for line, row in chunk:
+            try:
+                parsed.append(parse_row(row, uuid5(self.source_uuid, str(line))))
+            except (KeyError, TypeError, ValueError, InvalidOperation) as ex:
+                print(f'Row {line + 1} was rejected: {ex}')
+                self.state['rejected'] += 1
+
+        loaded = 0
+        async with async_session_maker() as session:
+            copy_rows = await self.get_copy_rows(session, parsed)
+            if copy_rows:
+                start = min(row[1] for row in copy_rows)
+                end = max(row[1] for row in copy_rows) + timedelta(microseconds=1)
+                await ensure_partitions(session, months_between(start, end))
+
+                await session.execute(text(f'CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} '
+                                           f'(LIKE {PARTITIONED_TABLE}) ON COMMIT DELETE ROWS'))
+                connection = await session.connection()
+                raw_connection = await connection.get_raw_connection()
+                await raw_connection.driver_connection.copy_records_to_table(STAGING_TABLE, records=copy_rows,
+                                                                             columns=COPY_COLUMNS)
+                columns = ', '.join(COPY_COLUMNS)
+                res = await session.execute(text(f'INSERT INTO {PARTITIONED_TABLE} ({columns}) '
+                                                 f'SELECT {columns} FROM {STAGING_TABLE} ON CONFLICT DO NOTHING'))
+                loaded = res.rowcount
+                await session.commit()
+
+                self.state['start'] = min(filter(None, [self.state['start'], start.isoformat()]))
+                self.state['end'] = max(filter(None, [self.state['end'], end.isoformat()]))
+
+        self.state['offset'] = chunk[-1][0] + 1
+        self.state['loaded'] += loaded
+        self.state['skins'] = {
+            str(skin_uuid): {label: last.isoformat() for label, last in labels.items()}
+            for skin_uuid, labels in self.last_labeled.items()
+        }
+        save_checkpoint(self.checkpoint_path, self.state)
+
+    async def get_copy_rows(self, session, parsed: list[tuple]) -> list[tuple]:
+        skin_uuids = {row[2] for row in parsed}
+        new_skin_uuids = skin_uuids - self.last_labeled.keys() - self.missing_skins
+        if new_skin_uuids:
+            existing_skin_uuids = await self.skins_repository.find_existing_uuids(session, new_skin_uuids)
+            self.missing_skins.update(new_skin_uuids - existing_skin_uuids)
+            if existing_skin_uuids:
+                # Скин может уже иметь более новые записи, их лейблы не должны влиять на загружаемую историю
+                until = min(row[1] for row in parsed)
+                since = until - max(LABEL_INTERVALS.values())
+                last_labeled = await self.records_repository.find_last_labeled(session, existing_skin_uuids,
+                                                                               since, until)
+                for skin_uuid in existing_skin_uuids:
+                    self.last_labeled[skin_uuid] = last_labeled.get(skin_uuid, dict())
+
+        copy_rows = list()
+        for uuid, registered_at, skin_uuid, price, count in parsed:
+            if skin_uuid in self.missing_skins:
+                print(f'Record {uuid} was rejected: skin {skin_uuid} not found.')
+                self.state['rejected'] += 1
+                continue
+
+            skin_last_labeled = self.last_labeled[skin_uuid]
+            labels = get_labels(registered_at, skin_last_labeled)
+            for label in labels:
+                skin_last_labeled[label] = registered_at
+            copy_rows.append((uuid, registered_at, skin_uuid, price, count, labels_to_mask(labels)))
+        return copy_rows
+
+    async def finish(self):
+        skin_uuids = [UUID(skin_uuid) for skin_uuid in self.state['skins']]
+        if skin_uuids:
+            async with async_session_maker() as session:
+                await RealtimeRecordsRepository().rebuild(session, skin_uuids)
+                await session.commit()
+            print('Realtime records were rebuilt.')
+
+            await rebuild_rollups(truncate(datetime.fromisoformat(self.state['start']), 'day'),
+                                  datetime.fromisoformat(self.state['end']))
+
+            # Индекс лейблов и версия realtime-цен могли устареть после загрузки
+            await LabelIndex(self.records_repository).forget(skin_uuids)
+            try:
+                await redis.incr(REALTIME_VERSION_KEY)
+            except RedisError:
+                pass
+
+        self.state['finished'] = True
+        save_checkpoint(self.checkpoint_path, self.state)
+        print(f'Done: loaded {self.state["loaded"]} records, rejected {self.state["rejected"]}.')
+
+
+def main():
+    parser = ArgumentParser(description='Bulk loader of historical records (NDJSON or CSV)')
+    parser.add_argument('path', help='input file with skin_uuid, price, count, registered_at and optional uuid')
+    parser.add_argument('--format', dest='input_format', choices=INPUT_FORMATS, default=None,
+                        help='input format, detected by the file extension by default')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (<path>.checkpoint by default)')
+
+    args = parser.parse_args()
+    input_format = args.input_format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+    loader = RecordsLoader(args.checkpoint or f'{args.path}.checkpoint')
+    asyncio.run(loader.load(args.path, input_format, args.chunk_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,43 @@
 from calendar import isleap
+from hashlib import md5
+from datetime import datetime, timedelta, timezone
+
+# Минимальный интервал между двумя записями с одним и тем же лейблом
+LABEL_INTERVALS = {
+    'year': timedelta(days=1),
+    'month': timedelta(hours=2),
+    'day': timedelta(minutes=15)
+}
+
+# Лейблы хранятся в базе битовой маской
+LABEL_BITS = {
+    'year': 1,
+    'month': 2,
+    'day': 4
+}
+
+CANDLE_BUCKETS = {
+    '15m': timedelta(minutes=15),
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+    '1w': timedelta(weeks=1)
+}
+
+# Компактные форматы графика: параллельные массивы времени, цен и количеств
+RECORDS_FORMATS = ['json', 'columnar', 'msgpack']
+# Источник графика: помеченные записи или предагрегированные данные (последняя цена за день или час)
+RECORDS_SOURCES = ['labels', 'rollup']
+COLUMNAR_MEDIA_TYPE = 'application/vnd.tradeoverseer.columnar+json'
+MSGPACK_MEDIA_TYPES = ['application/msgpack', 'application/x-msgpack']
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+EXPORT_COLUMNS = ['uuid', 'registered_at', 'skin_uuid', 'price', 'count', 'labels']
+
+MAX_BATCH_SIZE = 5000
+MAX_CANDLES = 1000
 
 
 def validate_price(price: str):
@@ -12,7 +51,16 @@ def validate_price(price: str):
 
 
 def validate_count(count: int):
-    return count >= 0
+    if count < 0:
+        raise ValueError('Invalid count. Should be a non-negative integer.')
+    return True
+
+
+def validate_batch_size(size: int):
+    if size == 0:
+        raise ValueError('Records required.')
+    if size > MAX_BATCH_SIZE:
+        raise ValueError(f'Too many records. Should contain not more than {MAX_BATCH_SIZE} records.')
 
 
 def validate_period(period: str):
@@ -21,10 +69,169 @@ def validate_period(period: str):
         raise ValueError('Invalid period. Should be one of "year", "month", "day".')
 
 
+def validate_source(source: str):
+    if source not in RECORDS_SOURCES:
+        raise ValueError(f'Invalid source. Should be one of {", ".join(RECORDS_SOURCES)}.')
+
+
+def validate_bucket(bucket: str):
+    if bucket not in CANDLE_BUCKETS:
+        raise ValueError(f'Invalid bucket. Should be one of {", ".join(CANDLE_BUCKETS)}.')
+
+
+def validate_candles_range(start: datetime, end: datetime, bucket: str):
+    if start >= end:
+        raise ValueError('Invalid time range. Start should be earlier than end.')
+    if (end - start) / CANDLE_BUCKETS[bucket] > MAX_CANDLES:
+        raise ValueError(f'Invalid time range. Should contain not more than {MAX_CANDLES} buckets.')
+
+
+def get_records_format(records_format: str | None = None, accept: str | None = None):
+    """
+    Function that selects the representation of records from the query parameter or the Accept header.
+    :param records_format: one of "json", "columnar", "msgpack" (has priority over the header)
+    :param accept: value of the Accept header
+    :return: one of "json", "columnar", "msgpack"
+    """
+    if records_format:
+        records_format = records_format.strip().lower()
+        if records_format not in RECORDS_FORMATS:
+            raise ValueError(f'Invalid format. Should be one of {", ".join(RECORDS_FORMATS)}.')
+        return records_format
+    if accept:
+        if any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+            return 'msgpack'
+        if COLUMNAR_MEDIA_TYPE in accept:
+            return 'columnar'
+    return 'json'
+
+
+def validate_export_format(export_format: str):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Invalid format. Should be one of {", ".join(EXPORT_FORMATS)}.')
+
+
 def validate_year_offset(year_offset: int):
     return year_offset >= 0
 
 
+def get_labels(registered_at: datetime, last_labeled: dict[str, datetime] | None = None):
+    """
+    Function that returns labels for a new record.
+    A record gets a label if there was no record with the same label during the label's interval.
+    :param registered_at: time of the new record
+    :param last_labeled: last time each label was assigned to a record of the same skin
+    :return: list of labels
+    """
+    last_labeled = last_labeled or dict()
+    labels = list()
+    for label, interval in LABEL_INTERVALS.items():
+        last = last_labeled.get(label)
+        if last is None or last < registered_at - interval:
+            labels.append(label)
+    return labels
+
+
+def labels_to_mask(labels: list[str]):
+    mask = 0
+    for label in labels:
+        mask |= LABEL_BITS[label]
+    return mask
+
+
+def mask_to_labels(mask: int):
+    return [label for label, bit in LABEL_BITS.items() if mask & bit]
+
+
+def get_period_range(period: str, now: datetime, year_offset: int | None = None):
+    """
+    Function that returns time range of the chart for the given period.
+    :param period: one of "year", "month", "day"
+    :param now: current time
+    :param year_offset: how many years ago the "year" chart ends
+    :return: tuple (start, end)
+    """
+    period = period.strip().lower()
+    if period == 'year':
+        year = timedelta(days=days_in_year(now.year))
+        year_offset = year_offset or 0
+        return now - (year_offset + 1) * year, now - year_offset * year
+    if period == 'month':
+        return now - timedelta(days=days_in_month(now.year, now.month)), now
+    return now - timedelta(days=1), now
+
+
+def get_realtime_etag(version: str, skin_uuids: list | None = None):
+    """
+    Function that returns ETag of a realtime snapshot.
+    :param version: version of realtime prices, changes on every ingest
+    :param skin_uuids: requested skins (None for the whole market)
+    """
+    skins = ','.join(sorted(str(skin_uuid) for skin_uuid in skin_uuids)) if skin_uuids else '*'
+    return f'W/"{version}-{md5(skins.encode()).hexdigest()[:16]}"'
+
+
+def truncate(moment: datetime, unit: str):
+    if unit == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if unit == 'week':
+        # Как date_trunc('week') в PostgreSQL: неделя начинается с понедельника
+        moment -= timedelta(days=moment.weekday())
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def series_to_points(series: dict):
+    """
+    Function that converts parallel arrays of a series to a list of points (the "json" format).
+    """
+    return [{
+        'registered_at': datetime.fromtimestamp(timestamp, tz=timezone.utc).replace(tzinfo=None),
+        'price': price,
+        'count': count
+    } for timestamp, price, count in zip(series['timestamps'], series['prices'], series['counts'])]
+
+
+def get_rollups(record_dicts: list[dict], unit: str):
+    """
+    Function that aggregates new records into rollup rows.
+    :param record_dicts: new records in order of registration
+    :param unit: "hour" or "day"
+    :return: list of rollup dicts, one per skin and bucket
+    """
+    rollups = dict()
+    for record_dict in record_dicts:
+        key = (record_dict['skin_uuid'], truncate(record_dict['registered_at'], unit))
+        price, count, registered_at = record_dict['price'], record_dict['count'], record_dict['registered_at']
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollups[key] = {
+                'skin_uuid': key[0],
+                'started_at': key[1],
+                'first_price': price,
+                'last_price': price,
+                'min_price': price,
+                'max_price': price,
+                'sum_price': price,
+                'min_count': count,
+                'max_count': count,
+                'last_count': count,
+                'samples': 1,
+                'first_registered_at': registered_at,
+                'last_registered_at': registered_at
+            }
+            continue
+        rollup['last_price'] = price
+        rollup['min_price'] = min(rollup['min_price'], price)
+        rollup['max_price'] = max(rollup['max_price'], price)
+        rollup['sum_price'] += price
+        rollup['min_count'] = min(rollup['min_count'], count)
+        rollup['max_count'] = max(rollup['max_count'], count)
+        rollup['last_count'] = count
+        rollup['samples'] += 1
+        rollup['last_registered_at'] = registered_at
+    return list(rollups.values())
+
+
 def days_in_year(year: int):
     return 366 if isleap(year) else 365
 
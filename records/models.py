@@ -1,31 +1,47 @@
 from uuid import uuid4
 from datetime import datetime
-from sqlalchemy import (TIMESTAMP, Column, ForeignKey, Integer, String, Uuid)
+from sqlalchemy import (TIMESTAMP, Column, ForeignKey, Index, Integer, Numeric, PrimaryKeyConstraint, SmallInteger,
+                        Uuid, text)
+from sqlalchemy.orm import declared_attr
 from utils.database import Base
 
 from skins.models import Skin
 
-from records.schemas import RecordRead, RealtimeRecordRead
+from records.schemas import RecordRead, RealtimeRecordRead, RecordRollupRead
+from records.logic import LABEL_BITS, mask_to_labels
 
 
 class Record(Base):
     __tablename__ = "record"
 
     uuid = Column(Uuid, primary_key=True, default=uuid4)
-    registered_at = Column(TIMESTAMP, default=datetime.utcnow)
+    # Таблица секционирована по месяцам, поэтому время регистрации входит в первичный ключ
+    registered_at = Column(TIMESTAMP, primary_key=True, default=datetime.utcnow)
     skin_uuid = Column(Uuid, ForeignKey(Skin.uuid))
-    price = Column(String, nullable=False)
+    price = Column(Numeric, nullable=False)
     count = Column(Integer, nullable=False)
-    labels = Column(String, nullable=False)
+    labels = Column(SmallInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_record_skin_uuid_registered_at', 'skin_uuid', 'registered_at'),
+        # Частичные индексы по лейблам: графики читают только точки со своим лейблом
+        Index('ix_record_year_skin_uuid_registered_at', 'skin_uuid', 'registered_at',
+              postgresql_where=text(f'(labels & {LABEL_BITS["year"]}) <> 0')),
+        Index('ix_record_month_skin_uuid_registered_at', 'skin_uuid', 'registered_at',
+              postgresql_where=text(f'(labels & {LABEL_BITS["month"]}) <> 0')),
+        Index('ix_record_day_skin_uuid_registered_at', 'skin_uuid', 'registered_at',
+              postgresql_where=text(f'(labels & {LABEL_BITS["day"]}) <> 0')),
+        {'postgresql_partition_by': 'RANGE (registered_at)'}
+    )
 
     def to_read_model(self) -> RecordRead:
         return RecordRead(
             uuid=self.uuid,
             registered_at=self.registered_at,
             skin_uuid=self.skin_uuid,
-            price=self.price,
+            price=str(self.price),
             count=self.count,
-            labels=self.labels
+            labels=mask_to_labels(self.labels)
         )
 
 
@@ -33,16 +49,67 @@ class RealtimeRecord(Base):
     __tablename__ = "realtime_record"
 
     skin_uuid = Column(Uuid, ForeignKey(Skin.uuid), primary_key=True, nullable=False)
-    previous_price = Column(String, nullable=True)
-    last_price = Column(String, nullable=False)
+    previous_price = Column(Numeric, nullable=True)
+    last_price = Column(Numeric, nullable=False)
     previous_count = Column(Integer, nullable=True)
     last_count = Column(Integer, nullable=False)
 
     def to_read_model(self) -> RealtimeRecordRead:
         return RealtimeRecordRead(
             skin_uuid=self.skin_uuid,
-            previous_price=self.previous_price,
-            last_price=self.last_price,
+            previous_price=str(self.previous_price) if self.previous_price is not None else None,
+            last_price=str(self.last_price),
             previous_count=self.previous_count,
             last_count=self.last_count
         )
+
+
+class RecordRollup(Base):
+    """
+    Pre-aggregated prices of a skin per time bucket, maintained on ingest.
+    """
+    __abstract__ = True
+
+    @declared_attr
+    def skin_uuid(cls):
+        return Column(Uuid, ForeignKey(Skin.uuid), nullable=False)
+
+    started_at = Column(TIMESTAMP, nullable=False)
+    first_price = Column(Numeric, nullable=False)
+    last_price = Column(Numeric, nullable=False)
+    min_price = Column(Numeric, nullable=False)
+    max_price = Column(Numeric, nullable=False)
+    sum_price = Column(Numeric, nullable=False)
+    min_count = Column(Integer, nullable=False)
+    max_count = Column(Integer, nullable=False)
+    last_count = Column(Integer, nullable=False)
+    samples = Column(Integer, nullable=False)
+    first_registered_at = Column(TIMESTAMP, nullable=False)
+    last_registered_at = Column(TIMESTAMP, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('skin_uuid', 'started_at'),
+    )
+
+    def to_read_model(self) -> RecordRollupRead:
+        return RecordRollupRead(
+            skin_uuid=self.skin_uuid,
+            started_at=self.started_at,
+            first_price=str(self.first_price),
+            last_price=str(self.last_price),
+            min_price=str(self.min_price),
+            max_price=str(self.max_price),
+            avg_price=str(self.sum_price / self.samples),
+            min_count=self.min_count,
+            max_count=self.max_count,
+            last_count=self.last_count,
+            samples=self.samples
+        )
+
+
+class RecordRollupHour(RecordRollup):
+    __tablename__ = "record_rollup_hour"
+
+
+class RecordRollupDay(RecordRollup):
+    __tablename__ = "record_rollup_day"
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import text
+
+from utils.database import async_session_maker
+
+PARTITIONED_TABLE = 'record'
+DEFAULT_PARTITION = f'{PARTITIONED_TABLE}_default'
+PARTITION_COLUMNS = 'uuid, registered_at, skin_uuid, price, count, labels'
+# Сколько месяцев после текущего должны иметь секции (миграция, приложение и команда create-partitions)
+MONTHS_AHEAD = 3
+PARTITIONS_LOCK_ID = 7302215
+PARTITIONS_CHECK_INTERVAL = 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(moment: datetime):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(moment: datetime):
+    moment = month_start(moment)
+    if moment.month == 12:
+        return moment.replace(year=moment.year + 1, month=1)
+    return moment.replace(month=moment.month + 1)
+
+
+def months_between(start: datetime, end: datetime):
+    """
+    Function that returns starts of all months that intersect [start, end).
+    """
+    months = list()
+    month = month_start(start)
+    while month < end:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def partition_months(months_ahead: int = MONTHS_AHEAD, start: datetime | None = None):
+    """
+    Function that returns months from start (the current one by default) to months_ahead months after the current.
+    """
+    now = datetime.now(tz=None)
+    end = next_month(now)
+    for _ in range(months_ahead):
+        end = next_month(end)
+    return months_between(start or now, end)
+
+
+def partition_name(month: datetime):
+    return f'{PARTITIONED_TABLE}_{month:%Y_%m}'
+
+
+def create_partition_sql(month: datetime):
+    return (f'CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARTITIONED_TABLE} '
+            f"FOR VALUES FROM ('{month_start(month):%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')")
+
+
+def create_default_partition_sql():
+    return f'CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARTITIONED_TABLE} DEFAULT'
+
+
+def detach_partition_sql(month: datetime):
+    return f'ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {partition_name(month)}'
+
+
+def list_partitions_sql():
+    return ('SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON pg_inherits.inhparent = parent.oid '
+            'JOIN pg_class child ON pg_inherits.inhrelid = child.oid '
+            f"WHERE parent.relname = '{PARTITIONED_TABLE}' ORDER BY child.relname")
+
+
+async def ensure_partitions(session, months: Iterable[datetime]):
+    """
+    Function that creates missing monthly partitions and the default partition.
+    Rows of a new month that already got into the default partition are moved to the new partition,
+    otherwise PostgreSQL refuses to attach it. The caller commits the session.
+    :param session: session
+    :param months: months that should have partitions
+    """
+    # Воркеры запускают это одновременно при старте, поэтому создание секций сериализуется
+    await session.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), {'lock_id': PARTITIONS_LOCK_ID})
+    await session.execute(text(create_default_partition_sql()))
+    res = await session.execute(text(list_partitions_sql()))
+    partitions = set(res.scalars().all())
+    for month in months:
+        name = partition_name(month)
+        if name in partitions:
+            continue
+        await session.execute(text(f'CREATE TABLE IF NOT EXISTS {name} (LIKE {PARTITIONED_TABLE} INCLUDING DEFAULTS)'))
+        await session.execute(text(f'''
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE registered_at >= :start AND registered_at < :end
+                RETURNING {PARTITION_COLUMNS}
+            )
+            INSERT INTO {name} ({PARTITION_COLUMNS}) SELECT {PARTITION_COLUMNS} FROM moved
+        '''), {'start': month_start(month), 'end': next_month(month)})
+        await session.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} ATTACH PARTITION {name} "
+                                   f"FOR VALUES FROM ('{month_start(month):%Y-%m-%d}') "
+                                   f"TO ('{next_month(month):%Y-%m-%d}')"))
+        partitions.add(name)
+
+
+async def maintain_partitions(interval: float = PARTITIONS_CHECK_INTERVAL):
+    """
+    Background task that keeps partitions created MONTHS_AHEAD months ahead while the app is running.
+    """
+    while True:
+        try:
+            async with async_session_maker() as session:
+                await ensure_partitions(session, partition_months())
+                await session.commit()
+        except Exception:
+            logger.exception('Record partitions were not created')
+        await asyncio.sleep(interval)
@@ -1,11 +1,295 @@
+from datetime import datetime
+from typing import Iterable, AsyncIterator
+from uuid import UUID
+
+from sqlalchemy import select, insert, delete, func, cast, case, literal_column, text, BigInteger, Float
+from sqlalchemy.dialects.postgresql import array_agg, aggregate_order_by
+
 from utils.repository import SQLAlchemyRepository
 
-from records.models import Record, RealtimeRecord
+from records.models import Record, RealtimeRecord, RecordRollupHour, RecordRollupDay
+from records.schemas import CandleRead
+from records.logic import LABEL_BITS
+
+STREAM_CHUNK_SIZE = 5000
+REBUILD_CHUNK_SIZE = 1000
+
+# Для каждого скина по индексу берутся две последние записи, lead() даёт предыдущую цену
+REBUILD_REALTIME_SQL = '''
+INSERT INTO realtime_record (skin_uuid, last_price, last_count, previous_price, previous_count)
+SELECT skins.skin_uuid, latest.price, latest.count, latest.previous_price, latest.previous_count
+FROM unnest(CAST(:skin_uuids AS uuid[])) AS skins(skin_uuid)
+CROSS JOIN LATERAL (
+    SELECT last_two.price, last_two.count,
+           lead(last_two.price) OVER (ORDER BY last_two.registered_at DESC) AS previous_price,
+           lead(last_two.count) OVER (ORDER BY last_two.registered_at DESC) AS previous_count
+    FROM (SELECT record.price, record.count, record.registered_at FROM record
+          WHERE record.skin_uuid = skins.skin_uuid
+          ORDER BY record.registered_at DESC LIMIT 2) AS last_two
+    ORDER BY last_two.registered_at DESC LIMIT 1
+) AS latest
+ON CONFLICT (skin_uuid) DO UPDATE SET
+    last_price = excluded.last_price,
+    last_count = excluded.last_count,
+    previous_price = excluded.previous_price,
+    previous_count = excluded.previous_count
+'''
 
 
 class RecordsRepository(SQLAlchemyRepository):
     model = Record
 
+    async def stream_all(self, session, skin_uuids: Iterable[UUID] | None = None, start: datetime | None = None,
+                         end: datetime | None = None) -> AsyncIterator[list]:
+        """
+        Function that streams records through a server-side cursor, so that memory does not depend on their number.
+        :return: async iterator of row chunks (uuid, registered_at, skin_uuid, price, count, labels)
+        """
+        stmt = (select(self.model.uuid, self.model.registered_at, self.model.skin_uuid,
+                       self.model.price, self.model.count, self.model.labels)
+                .order_by(self.model.skin_uuid, self.model.registered_at)
+                .execution_options(yield_per=STREAM_CHUNK_SIZE))
+        if skin_uuids:
+            stmt = stmt.where(self.model.skin_uuid.in_(list(skin_uuids)))
+        if start:
+            stmt = stmt.where(self.model.registered_at >= start)
+        if end:
+            stmt = stmt.where(self.model.registered_at < end)
+
+        res = await session.stream(stmt)
+        async for rows in res.partitions():
+            yield rows
+
+    async def find_last_labeled(self, session, skin_uuids: Iterable[UUID],
+                                since: datetime, until: datetime | None = None) -> dict[UUID, dict[str, datetime]]:
+        """
+        Function that returns the last time each label was assigned to a record of every given skin.
+        :param session: session
+        :param skin_uuids: skins to look up
+        :param since: records registered before this time are not taken into account
+        :param until: records registered at this time or later are not taken into account
+        :return: dict {skin_uuid: {label: registered_at}}
+        """
+        stmt = (select(self.model.skin_uuid,
+                       *(func.max(self.model.registered_at).filter(self.has_label(label)) for label in LABEL_BITS))
+                .where(self.model.skin_uuid.in_(list(skin_uuids)),
+                       self.model.registered_at >= since,
+                       self.model.labels != 0)
+                .group_by(self.model.skin_uuid))
+        if until:
+            stmt = stmt.where(self.model.registered_at < until)
+        res = await session.execute(stmt)
+
+        last_labeled = dict()
+        for skin_uuid, *registered_at in res.all():
+            last_labeled[skin_uuid] = {label: last for label, last in zip(LABEL_BITS, registered_at) if last}
+        return last_labeled
+
+    async def find_labeled(self, session, skin_uuid: UUID, label: str, start: datetime, end: datetime):
+        stmt = (select(self.model)
+                .where(self.model.skin_uuid == skin_uuid,
+                       self.model.registered_at.between(start, end),
+                       self.has_label(label))
+                .order_by(self.model.registered_at))
+        res = await session.execute(stmt)
+        return [row[0].to_read_model() for row in res.all()]
+
+    async def find_labeled_series(self, session, skin_uuid: UUID, label: str, start: datetime, end: datetime):
+        """
+        Function that returns labeled records as parallel arrays without building a model per row.
+        :return: dict {'timestamps': [epoch seconds], 'prices': [float], 'counts': [int]}
+        """
+        stmt = (select(cast(func.extract('epoch', self.model.registered_at), BigInteger),
+                       cast(self.model.price, Float),
+                       self.model.count)
+                .where(self.model.skin_uuid == skin_uuid,
+                       self.model.registered_at.between(start, end),
+                       self.has_label(label))
+                .order_by(self.model.registered_at))
+        res = await session.execute(stmt)
+        rows = res.all()
+        return {
+            'timestamps': [row[0] for row in rows],
+            'prices': [row[1] for row in rows],
+            'counts': [row[2] for row in rows]
+        }
+
+    async def find_candles(self, session, skin_uuid: UUID, start: datetime, end: datetime, bucket: str):
+        started_at = self.bucket_start(bucket).label('started_at')
+        stmt = (select(started_at,
+                       array_agg(aggregate_order_by(self.model.price, self.model.registered_at.asc()))[1],
+                       func.max(self.model.price),
+                       func.min(self.model.price),
+                       array_agg(aggregate_order_by(self.model.price, self.model.registered_at.desc()))[1],
+                       func.min(self.model.count),
+                       func.max(self.model.count),
+                       array_agg(aggregate_order_by(self.model.count, self.model.registered_at.desc()))[1])
+                .where(self.model.skin_uuid == skin_uuid,
+                       self.model.registered_at >= start,
+                       self.model.registered_at < end)
+                .group_by(started_at)
+                .order_by(started_at))
+        res = await session.execute(stmt)
+        return [CandleRead(started_at=row[0], open=str(row[1]), high=str(row[2]), low=str(row[3]), close=str(row[4]),
+                           min_count=row[5], max_count=row[6], last_count=row[7]) for row in res.all()]
+
+    def bucket_start(self, bucket: str):
+        # Без параметров запроса, чтобы выражение в GROUP BY совпадало с выражением в SELECT
+        if bucket == '15m':
+            return (func.date_trunc(literal_column("'hour'"), self.model.registered_at)
+                    + func.floor(func.extract('minute', self.model.registered_at) / literal_column('15'))
+                    * literal_column("interval '15 minutes'"))
+        unit = {'1h': 'hour', '1d': 'day', '1w': 'week'}[bucket]
+        return func.date_trunc(literal_column(f"'{unit}'"), self.model.registered_at)
+
+    def has_label(self, label: str):
+        # Маска подставляется литералом, чтобы условие совпадало с условием частичного индекса
+        return self.model.labels.op('&')(literal_column(str(LABEL_BITS[label]))) != literal_column('0')
+
 
 class RealtimeRecordsRepository(SQLAlchemyRepository):
     model = RealtimeRecord
+
+    async def find_by_skins(self, session, skin_uuids: Iterable[UUID] | None = None):
+        if skin_uuids is None:
+            return await self.find_all(session)
+        return await self.find_all(session, {'skin_uuid': ('in', skin_uuids)})
+
+    async def upsert(self, session, data: dict):
+        await self.upsert_many(session, [data])
+
+    async def upsert_many(self, session, data: list[dict]):
+        """
+        Function that inserts or updates realtime records in one statement per chunk.
+        The stored last_price and last_count are shifted into previous_* on the database side,
+        unless previous_* values are given explicitly (e.g. when a batch has several records of the same skin).
+        :param session: session
+        :param data: list of dicts with skin_uuid, last_price, last_count and optional previous_price, previous_count
+        """
+        data = [{'previous_price': None, 'previous_count': None, **item} for item in data]
+        await super().upsert_many(session, data, index_elements=['skin_uuid'], set_=lambda excluded: {
+            'previous_price': func.coalesce(excluded.previous_price, self.model.last_price),
+            'last_price': excluded.last_price,
+            'previous_count': func.coalesce(excluded.previous_count, self.model.last_count),
+            'last_count': excluded.last_count
+        })
+
+    async def rebuild(self, session, skin_uuids: Iterable[UUID]):
+        """
+        Function that recomputes realtime records of the given skins from their two latest records.
+        """
+        skin_uuids = list(skin_uuids)
+        for i in range(0, len(skin_uuids), REBUILD_CHUNK_SIZE):
+            await session.execute(text(REBUILD_REALTIME_SQL), {'skin_uuids': skin_uuids[i:i + REBUILD_CHUNK_SIZE]})
+
+
+class RecordRollupsRepository(SQLAlchemyRepository):
+    model = None
+    unit = None
+
+    async def merge_many(self, session, data: list[dict]):
+        """
+        Function that merges aggregates of new records into existing rollup rows.
+        :param session: session
+        :param data: rollup dicts (see records.logic.get_rollups)
+        """
+        await self.upsert_many(session, data, index_elements=['skin_uuid', 'started_at'], set_=self._merge_set)
+
+    def _merge_set(self, excluded) -> dict:
+        is_earlier = excluded.first_registered_at < self.model.first_registered_at
+        is_later = excluded.last_registered_at >= self.model.last_registered_at
+        return {
+            'first_price': case((is_earlier, excluded.first_price), else_=self.model.first_price),
+            'last_price': case((is_later, excluded.last_price), else_=self.model.last_price),
+            'min_price': func.least(self.model.min_price, excluded.min_price),
+            'max_price': func.greatest(self.model.max_price, excluded.max_price),
+            'sum_price': self.model.sum_price + excluded.sum_price,
+            'min_count': func.least(self.model.min_count, excluded.min_count),
+            'max_count': func.greatest(self.model.max_count, excluded.max_count),
+            'last_count': case((is_later, excluded.last_count), else_=self.model.last_count),
+            'samples': self.model.samples + excluded.samples,
+            'first_registered_at': func.least(self.model.first_registered_at, excluded.first_registered_at),
+            'last_registered_at': func.greatest(self.model.last_registered_at, excluded.last_registered_at)
+        }
+
+    async def rebuild(self, session, start: datetime, end: datetime, skin_uuid: UUID | None = None):
+        """
+        Function that recomputes rollup rows of buckets in [start, end) from raw records.
+        :param session: session
+        :param start: start of the first bucket
+        :param end: start of the bucket after the last one
+        :param skin_uuid: rebuild only this skin
+        """
+        started_at = func.date_trunc(literal_column(f"'{self.unit}'"), Record.registered_at)
+        aggregates = (select(Record.skin_uuid,
+                             started_at,
+                             array_agg(aggregate_order_by(Record.price, Record.registered_at.asc()))[1],
+                             array_agg(aggregate_order_by(Record.price, Record.registered_at.desc()))[1],
+                             func.min(Record.price),
+                             func.max(Record.price),
+                             func.sum(Record.price),
+                             func.min(Record.count),
+                             func.max(Record.count),
+                             array_agg(aggregate_order_by(Record.count, Record.registered_at.desc()))[1],
+                             func.count(),
+                             func.min(Record.registered_at),
+                             func.max(Record.registered_at))
+                      .where(Record.registered_at >= start, Record.registered_at < end)
+                      .group_by(Record.skin_uuid, started_at))
+        stale = delete(self.model).where(self.model.started_at >= start, self.model.started_at < end)
+        if skin_uuid:
+            aggregates = aggregates.where(Record.skin_uuid == skin_uuid)
+            stale = stale.where(self.model.skin_uuid == skin_uuid)
+
+        await session.execute(stale)
+        await session.execute(insert(self.model).from_select(
+            ['skin_uuid', 'started_at', 'first_price', 'last_price', 'min_price', 'max_price', 'sum_price',
+             'min_count', 'max_count', 'last_count', 'samples', 'first_registered_at', 'last_registered_at'],
+            aggregates))
+
+    async def find_series(self, session, skin_uuid: UUID, start: datetime, end: datetime):
+        stmt = (select(cast(func.extract('epoch', self.model.started_at), BigInteger),
+                       cast(self.model.last_price, Float),
+                       self.model.last_count)
+                .where(self.model.skin_uuid == skin_uuid,
+                       self.model.started_at.between(start, end))
+                .order_by(self.model.started_at))
+        res = await session.execute(stmt)
+        rows = res.all()
+        return {
+            'timestamps': [row[0] for row in rows],
+            'prices': [row[1] for row in rows],
+            'counts': [row[2] for row in rows]
+        }
+
+    async def find_candles(self, session, skin_uuid: UUID, start: datetime, end: datetime, unit: str):
+        """
+        Function that returns candles of the given unit, which should not be shorter than the rollup unit.
+        """
+        started_at = func.date_trunc(literal_column(f"'{unit}'"), self.model.started_at).label('started_at')
+        stmt = (select(started_at,
+                       array_agg(aggregate_order_by(self.model.first_price, self.model.started_at.asc()))[1],
+                       func.max(self.model.max_price),
+                       func.min(self.model.min_price),
+                       array_agg(aggregate_order_by(self.model.last_price, self.model.started_at.desc()))[1],
+                       func.min(self.model.min_count),
+                       func.max(self.model.max_count),
+                       array_agg(aggregate_order_by(self.model.last_count, self.model.started_at.desc()))[1])
+                .where(self.model.skin_uuid == skin_uuid,
+                       self.model.started_at >= start,
+                       self.model.started_at < end)
+                .group_by(started_at)
+                .order_by(started_at))
+        res = await session.execute(stmt)
+        return [CandleRead(started_at=row[0], open=str(row[1]), high=str(row[2]), low=str(row[3]), close=str(row[4]),
+                           min_count=row[5], max_count=row[6], last_count=row[7]) for row in res.all()]
+
+
+class HourRollupsRepository(RecordRollupsRepository):
+    model = RecordRollupHour
+    unit = 'hour'
+
+
+class DayRollupsRepository(RecordRollupsRepository):
+    model = RecordRollupDay
+    unit = 'day'
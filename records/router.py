@@ -1,72 +1,84 @@
+from typing import Annotated
 from uuid import UUID
+from datetime import datetime
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from utils.exceptions import exception_handler
+from utils.responses import MsgPackResponse
 from utils.dependency import (RecordsServiceDep,
-                              AuthenticationServiceDep,
-                              RolesServiceDep,
                               SkinsServiceDep,
-                              AuthenticationDep,
+                              PrincipalDep,
+                              Requires,
                               InsertAccessKeyDep,
+                              AcceptDep,
+                              IfNoneMatchDep,
                               UOWDep)
 
-from authentication.exceptions import NotAuthenticatedError
+from authentication.schemas import Principal
 from skins.exceptions import SkinNotFoundError
 
-from records.schemas import RecordCreate, RecordUpdate
+from records.schemas import RecordCreate, RecordUpdate, RecordBatchItemResult
 from records.logic import *
 from records.exceptions import *
 
 router = APIRouter(prefix='/records', tags=['Records'])
 
+ReadRecordsDep = Annotated[Principal, Depends(Requires('read_records', ReadRecordDenied))]
+UpdateRecordsDep = Annotated[Principal, Depends(Requires('update_records', UpdateRecordDenied))]
+DeleteRecordsDep = Annotated[Principal, Depends(Requires('delete_records', DeleteRecordDenied))]
+
 
 @router.get('')
 @exception_handler
 async def get_records_handler(records_service: RecordsServiceDep,
-                              authentication_service: AuthenticationServiceDep,
-                              roles_service: RolesServiceDep,
                               uow: UOWDep,
+                              author: ReadRecordsDep,
                               skin_uuid: UUID,
                               period: str,
                               year_offset: int | None = None,
-                              authorization: AuthenticationDep = None):
+                              format: str | None = None,
+                              source: str = 'labels',
+                              accept: AcceptDep = None):
     validate_period(period)
     if year_offset is not None:
         validate_year_offset(year_offset)
-
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_read = await roles_service.has_permission(uow, author, 'read_records')
-    if not can_read:
-        raise ReadRecordDenied
-
-    records = await records_service.get_records(uow, skin_uuid=skin_uuid, period=period, year_offset=year_offset)
-
-    return {
-        'data': records,
+    validate_source(source)
+    records_format = get_records_format(format, accept)
+
+    # Формат влияет только на представление: один и тот же source даёт одни и те же точки
+    if records_format == 'json' and source == 'labels':
+        records = await records_service.get_records(uow, skin_uuid=skin_uuid, period=period, year_offset=year_offset)
+        return {
+            'data': records,
+            'detail': 'Records were selected.'
+        }
+
+    # Колоночные форматы собираются прямо из строк базы и отдаются без jsonable_encoder
+    series = await records_service.get_records_series(uow, skin_uuid=skin_uuid, period=period,
+                                                      year_offset=year_offset, source=source)
+    if records_format == 'json':
+        return {
+            'data': series_to_points(series),
+            'detail': 'Records were selected.'
+        }
+
+    content = {
+        'data': series,
         'detail': 'Records were selected.'
     }
+    if records_format == 'msgpack':
+        return MsgPackResponse(content)
+    return JSONResponse(content)
 
 
 @router.get('/realtime')
 @exception_handler
 async def get_record_handler(records_service: RecordsServiceDep,
-                             authentication_service: AuthenticationServiceDep,
-                             roles_service: RolesServiceDep,
                              uow: UOWDep,
-                             skin_uuid: UUID,
-                             authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_read = await roles_service.has_permission(uow, author, 'read_records')
-    if not can_read:
-        raise ReadRecordDenied
-
+                             author: ReadRecordsDep,
+                             skin_uuid: UUID):
     record = await records_service.get_record(uow, skin_uuid=skin_uuid, realtime=True)
     if not record:
         raise RecordNotFoundError
@@ -77,22 +89,79 @@ async def get_record_handler(records_service: RecordsServiceDep,
     }
 
 
+@router.get('/realtime/snapshot')
+@exception_handler
+async def get_realtime_snapshot_handler(records_service: RecordsServiceDep,
+                                        uow: UOWDep,
+                                        author: ReadRecordsDep,
+                                        response: Response,
+                                        skin_uuids: list[UUID] | None = Query(None),
+                                        if_none_match: IfNoneMatchDep = None):
+    # Версия меняется при каждой вставке, поэтому неизменившийся снимок не нужно читать из базы
+    version = await records_service.get_realtime_version()
+    etag = get_realtime_etag(version, skin_uuids) if version is not None else None
+    if etag and if_none_match == etag:
+        return Response(status_code=304, headers={'ETag': etag})
+
+    # Реплика может отставать от версии, и устаревший снимок закешировался бы у клиента под новым ETag
+    await uow.pin_primary()
+    records = await records_service.get_realtime_records(uow, skin_uuids=skin_uuids)
+    if etag:
+        response.headers['ETag'] = etag
+
+    return {
+        'data': records,
+        'detail': 'Records were selected.'
+    }
+
+
+@router.get('/candles')
+@exception_handler
+async def get_candles_handler(records_service: RecordsServiceDep,
+                              uow: UOWDep,
+                              author: ReadRecordsDep,
+                              skin_uuid: UUID,
+                              bucket: str,
+                              start: datetime,
+                              end: datetime | None = None):
+    start = start.replace(tzinfo=None)
+    end = end.replace(tzinfo=None) if end else datetime.now(tz=None)
+    validate_bucket(bucket)
+    validate_candles_range(start, end, bucket)
+
+    candles = await records_service.get_candles(uow, skin_uuid=skin_uuid, start=start, end=end, bucket=bucket)
+
+    return {
+        'data': candles,
+        'detail': 'Candles were selected.'
+    }
+
+
+@router.get('/export')
+@exception_handler
+async def get_records_export_handler(records_service: RecordsServiceDep,
+                                     uow: UOWDep,
+                                     author: ReadRecordsDep,
+                                     skin_uuids: list[UUID] | None = Query(None),
+                                     start: datetime | None = None,
+                                     end: datetime | None = None,
+                                     format: str = 'ndjson'):
+    validate_export_format(format)
+    start = start.replace(tzinfo=None) if start else None
+    end = end.replace(tzinfo=None) if end else None
+
+    records = records_service.export_records(uow, format, skin_uuids=skin_uuids, start=start, end=end)
+    return StreamingResponse(records, media_type=EXPORT_FORMATS[format], headers={
+        'Content-Disposition': f'attachment; filename="records.{format}"'
+    })
+
+
 @router.get('/{uuid}')
 @exception_handler
 async def get_record_handler(records_service: RecordsServiceDep,
-                             authentication_service: AuthenticationServiceDep,
-                             roles_service: RolesServiceDep,
                              uow: UOWDep,
-                             uuid: UUID,
-                             authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_read = await roles_service.has_permission(uow, author, 'read_records')
-    if not can_read:
-        raise ReadRecordDenied
-
+                             author: ReadRecordsDep,
+                             uuid: UUID):
     record = await records_service.get_record(uow, uuid)
     if not record:
         raise RecordNotFoundError
@@ -107,19 +176,14 @@ async def get_record_handler(records_service: RecordsServiceDep,
 @exception_handler
 async def post_records_handler(record: RecordCreate,
                                records_service: RecordsServiceDep,
-                               authentication_service: AuthenticationServiceDep,
-                               roles_service: RolesServiceDep,
                                skins_service: SkinsServiceDep,
                                uow: UOWDep,
                                insert_access_key: InsertAccessKeyDep = None,
-                               authorization: AuthenticationDep = None):
-    validate_price(record.price)
+                               principal: PrincipalDep = None):
+    record.price = validate_price(record.price)
     validate_count(record.count)
 
-    author = await authentication_service.authenticated_user(uow, authorization)
-    can_insert = False
-    if author:
-        can_insert = await roles_service.has_permission(uow, author, 'insert_records')
+    can_insert = principal is not None and principal.has_permission('insert_records')
     if not can_insert:
         can_insert = records_service.has_insert_access(insert_access_key)
     if not can_insert:
@@ -136,29 +200,64 @@ async def post_records_handler(record: RecordCreate,
     }
 
 
+@router.post('/batch')
+@exception_handler
+async def post_records_batch_handler(records: list[RecordCreate],
+                                     records_service: RecordsServiceDep,
+                                     skins_service: SkinsServiceDep,
+                                     uow: UOWDep,
+                                     insert_access_key: InsertAccessKeyDep = None,
+                                     principal: PrincipalDep = None):
+    validate_batch_size(len(records))
+
+    can_insert = principal is not None and principal.has_permission('insert_records')
+    if not can_insert:
+        can_insert = records_service.has_insert_access(insert_access_key)
+    if not can_insert:
+        raise InsertRecordDenied
+
+    results = list()
+    for index, record in enumerate(records):
+        try:
+            record.price = validate_price(record.price)
+            validate_count(record.count)
+        except ValueError as ex:
+            results.append(RecordBatchItemResult(index=index, skin_uuid=record.skin_uuid, success=False,
+                                                 detail=str(ex)))
+        else:
+            results.append(RecordBatchItemResult(index=index, skin_uuid=record.skin_uuid, success=True,
+                                                 detail='Record was added.'))
+
+    existing_skin_uuids = await skins_service.get_existing_skin_uuids(
+        uow, {record.skin_uuid for record, result in zip(records, results) if result.success})
+    for result in results:
+        if result.success and result.skin_uuid not in existing_skin_uuids:
+            result.success = False
+            result.detail = str(SkinNotFoundError())
+
+    valid_records = [record for record, result in zip(records, results) if result.success]
+    if valid_records:
+        await records_service.add_records(uow, valid_records)
+
+    return {
+        'data': results,
+        'detail': f'{len(valid_records)} of {len(records)} records were added.'
+    }
+
+
 @router.put('/{uuid}')
 @exception_handler
 async def put_records_handler(record: RecordUpdate,
                               records_service: RecordsServiceDep,
-                              authentication_service: AuthenticationServiceDep,
-                              roles_service: RolesServiceDep,
                               skins_service: SkinsServiceDep,
                               uow: UOWDep,
-                              uuid: UUID,
-                              authorization: AuthenticationDep = None):
+                              author: UpdateRecordsDep,
+                              uuid: UUID):
     if record.price:
-        validate_price(record.price)
+        record.price = validate_price(record.price)
     if record.count is not None:
         validate_count(record.count)
 
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_update = await roles_service.has_permission(uow, author, 'update_records')
-    if not can_update:
-        raise UpdateRecordDenied
-
     record_with_this_uuid = await records_service.get_record(uow, uuid)
     if not record_with_this_uuid:
         raise RecordNotFoundError
@@ -178,19 +277,9 @@ async def put_records_handler(record: RecordUpdate,
 @router.delete('/{uuid}')
 @exception_handler
 async def delete_record_handler(records_service: RecordsServiceDep,
-                                authentication_service: AuthenticationServiceDep,
-                                roles_service: RolesServiceDep,
                                 uow: UOWDep,
-                                uuid: UUID,
-                                authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_delete = await roles_service.has_permission(uow, author, 'delete_records')
-    if not can_delete:
-        raise DeleteRecordDenied
-
+                                author: DeleteRecordsDep,
+                                uuid: UUID):
     record = await records_service.get_record(uow, uuid)
     if not record:
         raise RecordNotFoundError
@@ -40,3 +40,38 @@ class RealtimeRecordRead(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class RecordBatchItemResult(BaseModel):
+    index: int
+    skin_uuid: UUID
+    success: bool
+    detail: str
+
+
+class CandleRead(BaseModel):
+    started_at: datetime
+    open: str
+    high: str
+    low: str
+    close: str
+    min_count: int
+    max_count: int
+    last_count: int
+
+
+class RecordRollupRead(BaseModel):
+    skin_uuid: UUID
+    started_at: datetime
+    first_price: str
+    last_price: str
+    min_price: str
+    max_price: str
+    avg_price: str
+    min_count: int
+    max_count: int
+    last_count: int
+    samples: int
+
+    class Config:
+        from_attributes = True
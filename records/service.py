@@ -1,50 +1,106 @@
+from typing import Iterable
 from uuid import UUID, uuid4
+from csv import writer
+from io import StringIO
+from json import dumps
 from datetime import datetime, timedelta
-from json import dumps, loads
+from decimal import Decimal
+
+from redis.exceptions import RedisError
 
 from utils.unitofwork import IUnitOfWork
+from utils.redis import redis
 from utils.config import INSERT_ACCESS_KEY
 
 from records.repository import *
 from records.schemas import RecordCreate, RecordUpdate
-from records.logic import days_in_year, days_in_month
+from records.logic import get_period_range, labels_to_mask, mask_to_labels, get_rollups, truncate, EXPORT_COLUMNS
+from records.index import LabelIndex
+from records.exceptions import RecordNotFoundError
+
+REALTIME_VERSION_KEY = 'tradeoverseer-api-realtime-version'
+ROLLUP_CANDLE_UNITS = {'1h': 'hour', '1d': 'day', '1w': 'week'}
 
 
 class RecordsService:
     def __init__(self, records_repository: RecordsRepository,
-                 realtime_records_repository: RealtimeRecordsRepository):
+                 realtime_records_repository: RealtimeRecordsRepository,
+                 hour_rollups_repository: HourRollupsRepository,
+                 day_rollups_repository: DayRollupsRepository):
         self.records_repository = records_repository
         self.realtime_records_repository = realtime_records_repository
+        self.hour_rollups_repository = hour_rollups_repository
+        self.day_rollups_repository = day_rollups_repository
+        self.label_index = LabelIndex(records_repository)
 
     async def get_records(self, uow: IUnitOfWork, skin_uuid: UUID, period: str, year_offset: int | None = None):
         async with uow:
-            now = datetime.now(tz=None)
-            now_days_in_year = days_in_year(now.year)
-            now_days_in_month = days_in_month(now.year, now.month)
             period = period.strip().lower()
-            if period == 'year':
-                if year_offset is not None:
-                    records = await self.records_repository.find_all(uow.session, {
-                        'registered_at': ('between', now - (year_offset + 1) * timedelta(days=now_days_in_year),
-                                          now - year_offset * timedelta(days=now_days_in_year))
-                    }, skin_uuid=skin_uuid)
-                else:
-                    records = await self.records_repository.find_all(uow.session, {
-                        'registered_at': ('between', now - timedelta(days=now_days_in_year), now)
-                    }, skin_uuid=skin_uuid)
-                records = list(filter(lambda record: 'year' in loads(record.labels), records))
-            elif period == 'month':
-                records = await self.records_repository.find_all(uow.session, {
-                    'registered_at': ('between', now - timedelta(days=now_days_in_month), now)
-                }, skin_uuid=skin_uuid)
-                records = list(filter(lambda record: 'month' in loads(record.labels), records))
-            else:
-                records = await self.records_repository.find_all(uow.session, {
-                    'registered_at': ('between', now - timedelta(days=1), now)
-                }, skin_uuid=skin_uuid)
-                records = list(filter(lambda record: 'day' in loads(record.labels), records))
+            start, end = get_period_range(period, datetime.now(tz=None), year_offset)
+            records = await self.records_repository.find_labeled(uow.session, skin_uuid, period, start, end)
             return records
 
+    async def get_records_series(self, uow: IUnitOfWork, skin_uuid: UUID, period: str, year_offset: int | None = None,
+                                 source: str = 'labels'):
+        """
+        Function that returns the chart as parallel arrays.
+        :param source: "labels" for labeled records, "rollup" for the last price of every day (year) or hour (month)
+        """
+        async with uow:
+            period = period.strip().lower()
+            start, end = get_period_range(period, datetime.now(tz=None), year_offset)
+            if source == 'rollup' and period == 'year':
+                series = await self.day_rollups_repository.find_series(uow.session, skin_uuid, start, end)
+            elif source == 'rollup' and period == 'month':
+                series = await self.hour_rollups_repository.find_series(uow.session, skin_uuid, start, end)
+            else:
+                series = await self.records_repository.find_labeled_series(uow.session, skin_uuid, period, start, end)
+            return series
+
+    async def get_candles(self, uow: IUnitOfWork, skin_uuid: UUID, start: datetime, end: datetime, bucket: str):
+        async with uow:
+            if bucket in ROLLUP_CANDLE_UNITS:
+                # Свечи из агрегатов состоят из целых интервалов, поэтому границы выравниваются по интервалу:
+                # первый неполный интервал попадает целиком, а данные после end не попадают
+                unit = ROLLUP_CANDLE_UNITS[bucket]
+                start, end = truncate(start, unit), truncate(end, unit)
+            if bucket == '1h':
+                candles = await self.hour_rollups_repository.find_candles(uow.session, skin_uuid, start, end, 'hour')
+            elif bucket == '1d':
+                candles = await self.day_rollups_repository.find_candles(uow.session, skin_uuid, start, end, 'day')
+            elif bucket == '1w':
+                candles = await self.day_rollups_repository.find_candles(uow.session, skin_uuid, start, end, 'week')
+            else:
+                candles = await self.records_repository.find_candles(uow.session, skin_uuid, start, end, bucket)
+            return candles
+
+    async def export_records(self, uow: IUnitOfWork, export_format: str, skin_uuids: Iterable[UUID] | None = None,
+                             start: datetime | None = None, end: datetime | None = None):
+        """
+        Function that encodes records chunk by chunk while they are read from the database.
+        :return: async iterator of NDJSON or CSV text chunks
+        """
+        async with uow:
+            if export_format == 'csv':
+                yield ','.join(EXPORT_COLUMNS) + '\n'
+
+            async for rows in self.records_repository.stream_all(uow.session, skin_uuids, start, end):
+                if export_format == 'csv':
+                    buffer = StringIO()
+                    writer(buffer, lineterminator='\n').writerows(
+                        (uuid, registered_at.isoformat(), skin_uuid, price, count, ' '.join(mask_to_labels(labels)))
+                        for uuid, registered_at, skin_uuid, price, count, labels in rows)
+                    yield buffer.getvalue()
+                else:
+                    yield ''.join(dumps({
+                        'uuid': str(uuid),
+                        'registered_at': registered_at.isoformat(),
+                        'skin_uuid': str(skin_uuid),
+                        'price': str(price),
+                        'count': count,
+                        'labels': mask_to_labels(labels)
+                    }) + '\n' for uuid, registered_at, skin_uuid, price, count, labels in rows)
+
     async def get_record(self, uow: IUnitOfWork, uuid: UUID, skin_uuid: UUID | None = None, realtime: bool = False):
         async with uow:
             if realtime:
@@ -53,90 +109,148 @@ class RecordsService:
                 record = await self.records_repository.find_one(uow.session, uuid=uuid)
             return record
 
+    async def get_realtime_records(self, uow: IUnitOfWork, skin_uuids: Iterable[UUID] | None = None):
+        async with uow:
+            records = await self.realtime_records_repository.find_by_skins(uow.session, skin_uuids)
+            return records
+
+    @staticmethod
+    async def get_realtime_version() -> str | None:
+        """
+        Function that returns version of realtime prices shared by all workers, or None if it is unknown.
+        """
+        try:
+            version = await redis.get(REALTIME_VERSION_KEY)
+        except RedisError:
+            return None
+        return version.decode() if version else '0'
+
+    @staticmethod
+    async def _bump_realtime_version():
+        try:
+            await redis.incr(REALTIME_VERSION_KEY)
+        except RedisError:
+            pass
+
     async def add_record(self, uow: IUnitOfWork, record: RecordCreate):
         async with uow:
-            # Проверяем, какие лейблы нужно навесить новой записи.
-            # Т.е. проверяем, является ли запись первой за последние день, два часа и пятнадцать минут.
+            # Лейбл навешивается, если запись первая с таким лейблом за последние день, два часа или 15 минут
             now = datetime.now(tz=None)
+            labels = await self.label_index.claim(uow.session, record.skin_uuid, now)
 
-            labels = list()
-
-            day_records = await self.records_repository.find_all(uow.session, {
-                'registered_at': ('between', now - timedelta(days=1), now)
-            }, skin_uuid=record.skin_uuid)
-            day_records = list(filter(lambda rec: 'day' in loads(rec.labels), day_records))
-            if not day_records:
-                labels.append('year')
-
-            two_hours_records = await self.records_repository.find_all(uow.session, {
-                'registered_at': ('between', now - timedelta(hours=2), now)
-            }, skin_uuid=record.skin_uuid)
-            two_hours_records = list(filter(lambda rec: 'day' in loads(rec.labels), two_hours_records))
-            if not two_hours_records:
-                labels.append('month')
-
-            fifteen_minutes_records = await self.records_repository.find_all(uow.session, {
-                'registered_at': ('between', now - timedelta(minutes=15), now)
-            }, skin_uuid=record.skin_uuid)
-            fifteen_minutes_records = list(filter(lambda rec: 'day' in loads(rec.labels), fifteen_minutes_records))
-            if not fifteen_minutes_records:
-                labels.append('day')
-
-            # Сохраняем запись в базу
-            record_dict = {
-                'uuid': uuid4(),
-                'registered_at': now,
-                'skin_uuid': record.skin_uuid,
-                'price': record.price,
-                'count': record.count,
-                'labels': dumps(labels)
-            }
-            await self.records_repository.add_one(uow.session, record_dict)
-
-            # Обновляем значение цены в реальном времени (отдельная таблица)
-            prev_realtime_record = await self.realtime_records_repository.find_one(uow.session,
-                                                                                   skin_uuid=record_dict['skin_uuid'])
-            if prev_realtime_record:
-                realtime_record_dict = {
-                    'previous_price': prev_realtime_record.last_price,
-                    'last_price': record.price,
-                    'previous_count': prev_realtime_record.last_count,
-                    'last_count': record.count
+            try:
+                # Сохраняем запись в базу
+                record_dict = {
+                    'uuid': uuid4(),
+                    'registered_at': now,
+                    'skin_uuid': record.skin_uuid,
+                    'price': Decimal(record.price),
+                    'count': record.count,
+                    'labels': labels_to_mask(labels)
                 }
-                await self.realtime_records_repository.edit_one(uow.session, record_dict['skin_uuid'],
-                                                                realtime_record_dict)
-            else:
-                realtime_record_dict = {
+                await self.records_repository.add_one(uow.session, record_dict)
+                await self._merge_rollups(uow.session, [record_dict])
+
+                # Обновляем значение цены в реальном времени (отдельная таблица)
+                await self.realtime_records_repository.upsert(uow.session, {
                     'skin_uuid': record_dict['skin_uuid'],
-                    'previous_price': prev_realtime_record.last_price,
-                    'last_price': record.price,
-                    'previous_count': prev_realtime_record.last_count,
-                    'last_count': record.count
-                }
-                await self.realtime_records_repository.add_one(uow.session, realtime_record_dict)
+                    'last_price': record_dict['price'],
+                    'last_count': record_dict['count']
+                })
 
-            await uow.commit()
+                await uow.commit()
+            except BaseException:
+                # Запись не сохранилась, поэтому навешенные на неё лейблы нужно вернуть
+                await self.label_index.forget([record.skin_uuid])
+                raise
+            await self._bump_realtime_version()
+
+    async def add_records(self, uow: IUnitOfWork, records: list[RecordCreate]):
+        async with uow:
+            now = datetime.now(tz=None)
+            skin_uuids = {record.skin_uuid for record in records}
+
+            # Все записи пачки регистрируются одновременно, поэтому лейблы может получить только первая запись скина
+            claimed_labels = await self.label_index.claim_many(uow.session, skin_uuids, now)
+
+            try:
+                record_dicts = list()
+                for record in records:
+                    labels = claimed_labels.pop(record.skin_uuid, list())
+                    record_dicts.append({
+                        'uuid': uuid4(),
+                        'registered_at': now,
+                        'skin_uuid': record.skin_uuid,
+                        'price': Decimal(record.price),
+                        'count': record.count,
+                        'labels': labels_to_mask(labels)
+                    })
+                await self.records_repository.add_many(uow.session, record_dicts)
+                await self._merge_rollups(uow.session, record_dicts)
+
+                # Для цены в реальном времени важны только две последние записи каждого скина
+                realtime_record_dicts = dict()
+                for record_dict in record_dicts:
+                    prev_dict = realtime_record_dicts.get(record_dict['skin_uuid'])
+                    realtime_record_dicts[record_dict['skin_uuid']] = {
+                        'skin_uuid': record_dict['skin_uuid'],
+                        'previous_price': prev_dict['last_price'] if prev_dict else None,
+                        'last_price': record_dict['price'],
+                        'previous_count': prev_dict['last_count'] if prev_dict else None,
+                        'last_count': record_dict['count']
+                    }
+                await self.realtime_records_repository.upsert_many(uow.session, list(realtime_record_dicts.values()))
+
+                await uow.commit()
+            except BaseException:
+                await self.label_index.forget(skin_uuids)
+                raise
+            await self._bump_realtime_version()
 
     async def update_record(self, uow: IUnitOfWork, uuid: UUID, record: RecordUpdate):
         async with uow:
+            prev_record = await self.records_repository.find_one(uow.session, uuid=uuid)
+            if not prev_record:
+                # Запись могла быть удалена параллельным запросом после проверки в обработчике
+                raise RecordNotFoundError
+
             record_dict = dict()
             if record.registered_at:
                 record_dict['registered_at'] = record.registered_at.replace(tzinfo=None)
             if record.skin_uuid:
                 record_dict['skin_uuid'] = record.skin_uuid
             if record.price:
-                record_dict['price'] = record.price
+                record_dict['price'] = Decimal(record.price)
             if record.count is not None:
                 record_dict['count'] = record.count
 
             await self.records_repository.edit_one(uow.session, uuid, record_dict)
+
+            # Изменённая запись могла переехать в другой скин или другой промежуток, пересчитываем оба
+            await self._rebuild_rollups(uow.session, prev_record.skin_uuid, prev_record.registered_at)
+            await self._rebuild_rollups(uow.session, record_dict.get('skin_uuid', prev_record.skin_uuid),
+                                        record_dict.get('registered_at', prev_record.registered_at))
             await uow.commit()
 
     async def delete_record(self, uow: IUnitOfWork, uuid: UUID):
         async with uow:
+            prev_record = await self.records_repository.find_one(uow.session, uuid=uuid)
+            if not prev_record:
+                raise RecordNotFoundError
             await self.records_repository.delete_one(uow.session, uuid)
+            await self._rebuild_rollups(uow.session, prev_record.skin_uuid, prev_record.registered_at)
             await uow.commit()
 
+    async def _merge_rollups(self, session, record_dicts: list[dict]):
+        await self.hour_rollups_repository.merge_many(session, get_rollups(record_dicts, 'hour'))
+        await self.day_rollups_repository.merge_many(session, get_rollups(record_dicts, 'day'))
+
+    async def _rebuild_rollups(self, session, skin_uuid: UUID, registered_at: datetime):
+        start = truncate(registered_at, 'hour')
+        await self.hour_rollups_repository.rebuild(session, start, start + timedelta(hours=1), skin_uuid)
+        start = truncate(registered_at, 'day')
+        await self.day_rollups_repository.rebuild(session, start, start + timedelta(days=1), skin_uuid)
+
     @staticmethod
     def has_insert_access(insert_access: str | None = None):
         if insert_access:
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from time import monotonic
+from uuid import UUID
+
+from redis.exceptions import RedisError
+
+from utils.redis import redis
+from utils.database import async_session_maker
+from utils.config import PERMISSION_INDEX_MAX_AGE
+
+from roles.repository import RolesRepository
+
+ROLES_VERSION_KEY = 'tradeoverseer-api-roles-version'
+ROLES_CHANNEL = 'tradeoverseer-api-roles'
+LISTEN_RETRY_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+
+class PermissionIndex:
+    """
+    In-memory index {role uuid: permissions} of a worker.
+    All roles are loaded with one query, after that permission checks do not touch the database.
+    Changes of roles are versioned in Redis and announced through pub/sub, so that every worker drops its copy.
+    If an announcement is lost (Redis was unavailable), the copy is still reloaded after max_age seconds.
+    """
+
+    def __init__(self, roles_repository: RolesRepository, max_age: float = PERMISSION_INDEX_MAX_AGE):
+        self.roles_repository = roles_repository
+        self.max_age = max_age
+        self.permissions: dict[UUID, frozenset[str]] | None = None
+        self.loaded_at = 0.0
+        self.version: int | None = None
+        # Растёт при каждой инвалидации, чтобы загрузка, начатая до изменения ролей, не сохранила старые данные
+        self.generation = 0
+        self.lock = asyncio.Lock()
+
+    async def get_permissions(self) -> dict[UUID, frozenset[str]]:
+        permissions = self.permissions
+        if permissions is not None and monotonic() - self.loaded_at < self.max_age:
+            return permissions
+
+        async with self.lock:
+            if self.permissions is None or monotonic() - self.loaded_at >= self.max_age:
+                generation = self.generation
+                # Роли читаются с primary: отстающая реплика вернула бы данные до изменения
+                async with async_session_maker() as session:
+                    roles = await self.roles_repository.find_all(session)
+                permissions = {role.uuid: frozenset(role.permissions) for role in roles}
+                if generation == self.generation:
+                    self.permissions = permissions
+                    self.loaded_at = monotonic()
+                return permissions
+            return self.permissions
+
+    def invalidate(self):
+        self.generation += 1
+        self.permissions = None
+
+    async def publish(self):
+        """
+        Function that drops the index in this worker and announces the change of roles to other workers.
+        """
+        self.invalidate()
+        try:
+            version = await redis.incr(ROLES_VERSION_KEY)
+            await redis.publish(ROLES_CHANNEL, version)
+        except RedisError:
+            logger.warning('Change of roles was not announced, other workers will reload roles after %s s',
+                           self.max_age, exc_info=True)
+
+    async def listen(self):
+        """
+        Function that drops the index whenever another worker changes roles. Runs until cancelled.
+        """
+        while True:
+            try:
+                async with redis.pubsub() as pubsub:
+                    await pubsub.subscribe(ROLES_CHANNEL)
+                    # Пока подписки не было, сообщения могли потеряться: сверяем версию
+                    await self._check_version()
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.version = int(message['data'])
+                            self.invalidate()
+            except Exception:
+                # Любая ошибка только перезапускает подписку, иначе воркер перестал бы узнавать об изменениях ролей
+                logger.warning('Subscription to changes of roles failed, retrying in %s s', LISTEN_RETRY_DELAY,
+                               exc_info=True)
+                await asyncio.sleep(LISTEN_RETRY_DELAY)
+
+    async def _check_version(self):
+        version = int(await redis.get(ROLES_VERSION_KEY) or 0)
+        if version != self.version:
+            self.version = version
+            self.invalidate()
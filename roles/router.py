@@ -1,62 +1,52 @@
+from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter
-from fastapi_cache.decorator import cache
-from fastapi_cache import FastAPICache
-
+from fastapi import APIRouter, Depends
 from utils.exceptions import exception_handler
-from utils.dependency import (AuthenticationServiceDep,
-                              RolesServiceDep,
-                              AuthenticationDep,
+from utils.cache import cached, invalidate_tags
+from utils.logic import validate_limit, DEFAULT_PAGE_LIMIT
+from utils.dependency import (RolesServiceDep,
+                              Requires,
                               UOWDep)
 
-from authentication.exceptions import NotAuthenticatedError
+from authentication.schemas import Principal
 
 from roles.schemas import RoleCreate, RoleUpdate
 from roles.exceptions import *
 
 router = APIRouter(prefix='/roles', tags=['Roles'])
 
+ReadRolesDep = Annotated[Principal, Depends(Requires('read_roles', ReadRoleDenied))]
+InsertRolesDep = Annotated[Principal, Depends(Requires('insert_roles', InsertRoleDenied))]
+UpdateRolesDep = Annotated[Principal, Depends(Requires('update_roles', UpdateRoleDenied))]
+DeleteRolesDep = Annotated[Principal, Depends(Requires('delete_roles', DeleteRoleDenied))]
+
 
 @router.get('')
-@cache(namespace='roles', expire=3600)
+@cached(namespace='roles', expire=3600, tags=['roles'])
 @exception_handler
 async def get_roles_handler(roles_service: RolesServiceDep,
-                            authentication_service: AuthenticationServiceDep,
                             uow: UOWDep,
+                            author: ReadRolesDep,
                             name: str | None = None,
-                            authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_read = await roles_service.has_permission(uow, author, 'read_roles')
-    if not can_read:
-        raise ReadRoleDenied
-
-    roles = await roles_service.get_roles(uow, name=name)
+                            limit: int = DEFAULT_PAGE_LIMIT,
+                            cursor: str | None = None):
+    validate_limit(limit)
+    roles, next_cursor = await roles_service.get_roles_page(uow, limit, cursor, name=name)
     return {
         'data': roles,
+        'next_cursor': next_cursor,
         'detail': 'Roles were selected.'
     }
 
 
 @router.get('/{uuid}')
-@cache(namespace='roles', expire=3600)
+@cached(namespace='roles', expire=3600, tags=['role:{uuid}'])
 @exception_handler
-async def get_role_handler(authentication_service: AuthenticationServiceDep,
-                           roles_service: RolesServiceDep,
+async def get_role_handler(roles_service: RolesServiceDep,
                            uow: UOWDep,
-                           uuid: UUID,
-                           authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_read = await roles_service.has_permission(uow, author, 'read_roles')
-    if not can_read:
-        raise ReadRoleDenied
-
+                           author: ReadRolesDep,
+                           uuid: UUID):
     role = await roles_service.get_role(uow, uuid)
     if not role:
         raise RoleNotFoundError
@@ -70,21 +60,11 @@ async def get_role_handler(authentication_service: AuthenticationServiceDep,
 @router.post('/')
 @exception_handler
 async def post_role_handler(uow: UOWDep,
-                            authentication_service: AuthenticationServiceDep,
+                            author: InsertRolesDep,
                             roles_service: RolesServiceDep,
-                            role: RoleCreate,
-                            authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_insert = await roles_service.has_permission(uow, author, 'insert_roles')
-    if not can_insert:
-        raise InsertRoleDenied
-
+                            role: RoleCreate):
     await roles_service.add_role(uow, role)
-    await FastAPICache.clear(namespace='roles')
-    await FastAPICache.clear(namespace='users')
+    await invalidate_tags('roles')
     return {
         'data': None,
         'detail': 'Role was added.'
@@ -94,26 +74,16 @@ async def post_role_handler(uow: UOWDep,
 @router.put('/{uuid}')
 @exception_handler
 async def put_role_handler(uow: UOWDep,
-                           authentication_service: AuthenticationServiceDep,
+                           author: UpdateRolesDep,
                            roles_service: RolesServiceDep,
                            uuid: UUID,
-                           role: RoleUpdate,
-                           authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                           role: RoleUpdate):
     role_with_this_uuid = await roles_service.get_role(uow, uuid)
     if not role_with_this_uuid:
         raise RoleNotFoundError
 
-    can_update = await roles_service.has_permission(uow, author, 'update_roles')
-    if not can_update:
-        raise UpdateRoleDenied
-
     await roles_service.update_role(uow, uuid, role)
-    await FastAPICache.clear(namespace='roles')
-    await FastAPICache.clear(namespace='users')
+    await invalidate_tags('roles', f'role:{uuid}')
     return {
         'data': None,
         'detail': 'Role was updated.'
@@ -123,25 +93,15 @@ async def put_role_handler(uow: UOWDep,
 @router.delete('/{uuid}')
 @exception_handler
 async def delete_role_handler(uow: UOWDep,
-                              authentication_service: AuthenticationServiceDep,
+                              author: DeleteRolesDep,
                               roles_service: RolesServiceDep,
-                              uuid: UUID,
-                              authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                              uuid: UUID):
     role_with_this_uuid = await roles_service.get_role(uow, uuid)
     if not role_with_this_uuid:
         raise RoleNotFoundError
 
-    can_delete = await roles_service.has_permission(uow, author, 'delete_roles')
-    if not can_delete:
-        raise DeleteRoleDenied
-
     await roles_service.delete_role(uow, uuid)
-    await FastAPICache.clear(namespace='roles')
-    await FastAPICache.clear(namespace='users')
+    await invalidate_tags('roles', f'role:{uuid}')
     return {
         'data': None,
         'detail': 'Role was deleted.'
@@ -7,12 +7,14 @@ from utils.unitofwork import IUnitOfWork
 from users.schemas import UserRead, UserCreate, UserUpdate
 
 from roles.repository import RolesRepository
+from roles.index import PermissionIndex
 from roles.schemas import RoleCreate, RoleUpdate
 
 
 class RolesService:
     def __init__(self, roles_repository: RolesRepository):
         self.roles_repository = roles_repository
+        self.permission_index = PermissionIndex(roles_repository)
 
     async def get_roles(self, uow: IUnitOfWork, name: str | None = None):
         filter_by = {'name': name} if name else {}
@@ -20,6 +22,12 @@ class RolesService:
             roles = await self.roles_repository.find_all(uow.session, **filter_by)
             return roles
 
+    async def get_roles_page(self, uow: IUnitOfWork, limit: int, cursor: str | None = None, name: str | None = None):
+        filter_by = {'name': name} if name else {}
+        async with uow:
+            roles, next_cursor = await self.roles_repository.find_page(uow.session, limit, cursor, **filter_by)
+            return roles, next_cursor
+
     async def get_role(self, uow: IUnitOfWork, uuid: UUID):
         async with uow:
             role = await self.roles_repository.find_one(uow.session, uuid=uuid)
@@ -34,6 +42,7 @@ class RolesService:
             }
             await self.roles_repository.add_one(uow.session, role_dict)
             await uow.commit()
+        await self.permission_index.publish()
 
     async def update_role(self, uow: IUnitOfWork, uuid: UUID, role: RoleUpdate):
         async with uow:
@@ -43,17 +52,20 @@ class RolesService:
             }
             await self.roles_repository.edit_one(uow.session, uuid, role_dict)
             await uow.commit()
+        await self.permission_index.publish()
 
     async def delete_role(self, uow: IUnitOfWork, uuid: UUID):
         async with uow:
             await self.roles_repository.delete_one(uow.session, uuid)
             await uow.commit()
+        await self.permission_index.publish()
 
     async def delete_roles(self, uow: IUnitOfWork, name: str | None = None):
         filter_by_dict = {'name': name} if name else {}
         async with uow:
             await self.roles_repository.delete_all(uow.session, **filter_by_dict)
             await uow.commit()
+        await self.permission_index.publish()
 
     async def get_fake_role(self, uow: IUnitOfWork, roles: Iterable) -> str | None:
         """
@@ -62,14 +74,20 @@ class RolesService:
         :param uow: unit of work
         :return: fake role's uuid or None if it does not exist
         """
+        permissions = await self.permission_index.get_permissions()
         for role_uuid in roles:
-            role = await self.get_role(uow, role_uuid)
-            if not role:
+            if UUID(str(role_uuid)) not in permissions:
                 return role_uuid
 
+    async def get_permissions(self, uow: IUnitOfWork, roles: Iterable) -> frozenset[str]:
+        """
+        Function that returns the union of permissions of the given roles.
+        :param uow: unit of work
+        :param roles: uuids of roles
+        :return: set of permissions
+        """
+        permissions = await self.permission_index.get_permissions()
+        return frozenset().union(*(permissions.get(UUID(str(role_uuid)), ()) for role_uuid in roles))
+
     async def has_permission(self, uow: IUnitOfWork, user: UserRead | UserCreate | UserUpdate, permission: str):
-        for role_uuid in user.roles:
-            role = await self.get_role(uow, role_uuid)
-            if role and permission in role.permissions:
-                return True
-        return False
+        return permission in await self.get_permissions(uow, user.roles)
@@ -1,3 +1,8 @@
+from typing import Iterable
+from uuid import UUID
+
+from sqlalchemy import select
+
 from utils.repository import SQLAlchemyRepository
 
 from skins.models import Skin
@@ -5,3 +10,8 @@ from skins.models import Skin
 
 class SkinsRepository(SQLAlchemyRepository):
     model = Skin
+
+    async def find_existing_uuids(self, session, uuids: Iterable[UUID]) -> set[UUID]:
+        stmt = select(self.model.uuid).where(self.model.uuid.in_(list(uuids)))
+        res = await session.execute(stmt)
+        return set(res.scalars().all())
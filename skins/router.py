@@ -1,66 +1,52 @@
+from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter
-from fastapi_cache.decorator import cache
-from fastapi_cache import FastAPICache
-
-from utils.logic import equal_uuids
+from fastapi import APIRouter, Depends
+from utils.logic import equal_uuids, validate_limit, DEFAULT_PAGE_LIMIT
 from utils.exceptions import exception_handler
+from utils.cache import cached, invalidate_tags
 from utils.dependency import (SkinsServiceDep,
-                              AuthenticationDep,
-                              RolesServiceDep,
-                              UOWDep,
-                              AuthenticationServiceDep)
+                              Requires,
+                              UOWDep)
 
-from authentication.exceptions import NotAuthenticatedError
+from authentication.schemas import Principal
 
 from skins.exceptions import *
 from skins.schemas import SkinCreate, SkinUpdate
 
 router = APIRouter(prefix='/skins', tags=['Skins'])
 
+ReadSkinsDep = Annotated[Principal, Depends(Requires('read_skins', ReadSkinDenied))]
+InsertSkinsDep = Annotated[Principal, Depends(Requires('insert_skins', InsertSkinDenied))]
+UpdateSkinsDep = Annotated[Principal, Depends(Requires('update_skins', UpdateSkinDenied))]
+DeleteSkinsDep = Annotated[Principal, Depends(Requires('delete_skins', DeleteSkinDenied))]
+
 
 @router.get('')
-@cache(namespace='skins', expire=3600)
+@cached(namespace='skins', expire=3600, tags=['skins'])
 @exception_handler
 async def get_skins_handler(skins_service: SkinsServiceDep,
-                            authentication_service: AuthenticationServiceDep,
-                            roles_service: RolesServiceDep,
                             uow: UOWDep,
+                            author: ReadSkinsDep,
                             name: str | None = None,
-                            authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_read = await roles_service.has_permission(uow, author, 'read_skins')
-    if not can_read:
-        raise ReadSkinDenied
-
-    skins = await skins_service.get_skins(uow, name=name)
+                            limit: int = DEFAULT_PAGE_LIMIT,
+                            cursor: str | None = None):
+    validate_limit(limit)
+    skins, next_cursor = await skins_service.get_skins_page(uow, limit, cursor, name=name)
     return {
         'data': skins,
+        'next_cursor': next_cursor,
         'detail': 'Skins were selected.'
     }
 
 
 @router.get('/{uuid}')
-@cache(namespace='skins', expire=3600)
+@cached(namespace='skins', expire=3600, tags=['skin:{uuid}'])
 @exception_handler
 async def get_skin_handler(skins_service: SkinsServiceDep,
-                           authentication_service: AuthenticationServiceDep,
-                           roles_service: RolesServiceDep,
                            uow: UOWDep,
-                           uuid: UUID,
-                           authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_read = await roles_service.has_permission(uow, author, 'read_skins')
-    if not can_read:
-        raise ReadSkinDenied
-
+                           author: ReadSkinsDep,
+                           uuid: UUID):
     skin = await skins_service.get_skin(uow, uuid)
     if not skin:
         raise SkinNotFoundError
@@ -74,23 +60,12 @@ async def get_skin_handler(skins_service: SkinsServiceDep,
 @router.post('/')
 @exception_handler
 async def post_skin_handler(uow: UOWDep,
-                            authentication_service: AuthenticationServiceDep,
-                            roles_service: RolesServiceDep,
+                            author: InsertSkinsDep,
                             skins_service: SkinsServiceDep,
                             uuid: UUID,
-                            skin: SkinCreate,
-                            authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    can_insert = await roles_service.has_permission(uow, author, 'insert_skins')
-    if not can_insert:
-        raise InsertSkinDenied
-
+                            skin: SkinCreate):
     await skins_service.add_skin(uow, skin)
-    await FastAPICache.clear(namespace='skins')
-    await FastAPICache.clear(namespace='inventory')
+    await invalidate_tags('skins')
     return {
         'data': None,
         'detail': 'Skin was added.'
@@ -100,27 +75,16 @@ async def post_skin_handler(uow: UOWDep,
 @router.put('/{uuid}')
 @exception_handler
 async def put_skin_handler(uow: UOWDep,
-                           authentication_service: AuthenticationServiceDep,
-                           roles_service: RolesServiceDep,
+                           author: UpdateSkinsDep,
                            skins_service: SkinsServiceDep,
                            uuid: UUID,
-                           skin: SkinUpdate,
-                           authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                           skin: SkinUpdate):
     skin_with_this_uuid = await skins_service.get_skin(uow, uuid)
     if not skin_with_this_uuid:
         raise SkinNotFoundError
 
-    can_update = await roles_service.has_permission(uow, author, 'update_skins')
-    if not can_update:
-        raise UpdateSkinDenied
-
     await skins_service.update_skin(uow, uuid, skin)
-    await FastAPICache.clear(namespace='skins')
-    await FastAPICache.clear(namespace='inventory')
+    await invalidate_tags('skins', f'skin:{uuid}')
     return {
         'data': None,
         'detail': 'Skin was updated.'
@@ -130,26 +94,15 @@ async def put_skin_handler(uow: UOWDep,
 @router.delete('/{uuid}')
 @exception_handler
 async def delete_skin_handler(uow: UOWDep,
-                              authentication_service: AuthenticationServiceDep,
-                              roles_service: RolesServiceDep,
+                              author: DeleteSkinsDep,
                               skins_service: SkinsServiceDep,
-                              uuid: UUID,
-                              authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                              uuid: UUID):
     skin_with_this_uuid = await skins_service.get_skin(uow, uuid)
     if not skin_with_this_uuid:
         raise SkinNotFoundError
 
-    can_delete = await roles_service.has_permission(uow, author, 'delete_skins')
-    if not can_delete:
-        raise DeleteSkinDenied
-
     await skins_service.delete_skin(uow, uuid)
-    await FastAPICache.clear(namespace='skins')
-    await FastAPICache.clear(namespace='inventory')
+    await invalidate_tags('skins', f'skin:{uuid}')
     return {
         'data': None,
         'detail': 'Skin was deleted.'
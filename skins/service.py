@@ -1,3 +1,4 @@
+from typing import Iterable
 from uuid import UUID, uuid4
 
 from utils.unitofwork import IUnitOfWork
@@ -16,11 +17,22 @@ class SkinsService:
             skins = await self.skins_repository.find_all(uow.session, **filter_by_dict)
             return skins
 
+    async def get_skins_page(self, uow: IUnitOfWork, limit: int, cursor: str | None = None, name: str | None = None):
+        filter_by_dict = {'name': name} if name else {}
+        async with uow:
+            skins, next_cursor = await self.skins_repository.find_page(uow.session, limit, cursor, **filter_by_dict)
+            return skins, next_cursor
+
     async def get_skin(self, uow: IUnitOfWork, uuid: UUID):
         async with uow:
             skin = await self.skins_repository.find_one(uow.session, uuid=uuid)
             return skin
 
+    async def get_existing_skin_uuids(self, uow: IUnitOfWork, uuids: Iterable[UUID]) -> set[UUID]:
+        async with uow:
+            existing_uuids = await self.skins_repository.find_existing_uuids(uow.session, uuids)
+            return existing_uuids
+
     async def add_skin(self, uow: IUnitOfWork, skin: SkinCreate):
         async with uow:
             skin_dict = {
@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+from uuid import uuid4
+
+from records.loader import RecordsLoader
+from records.logic import LABEL_BITS, mask_to_labels
+
+
+class RecordsRepositoryStub:
+    """
+    Records of one skin in memory, find_last_labeled filters them like the SQL query.
+    """
+
+    def __init__(self, records: list[tuple]):
+        self.records = records
+
+    async def find_last_labeled(self, session, skin_uuids, since, until=None):
+        last_labeled = dict()
+        for skin_uuid, registered_at, labels in self.records:
+            if skin_uuid not in skin_uuids or registered_at < since or (until and registered_at >= until):
+                continue
+            skin_last_labeled = last_labeled.setdefault(skin_uuid, dict())
+            for label in labels:
+                skin_last_labeled[label] = max(registered_at, skin_last_labeled.get(label, registered_at))
+        return last_labeled
+
+
+class SkinsRepositoryStub:
+    def __init__(self, skin_uuids: set):
+        self.skin_uuids = skin_uuids
+
+    async def find_existing_uuids(self, session, uuids):
+        return self.skin_uuids & set(uuids)
+
+
+def test_history_of_live_skin_is_labeled(tmp_path):
+    skin_uuid = uuid4()
+    now = datetime(2024, 5, 1, 12)
+    # Скин уже отслеживается: свежая запись получила все лейблы
+    live_records = [(skin_uuid, now, list(LABEL_BITS))]
+
+    loader = RecordsLoader(str(tmp_path / 'checkpoint'))
+    loader.records_repository = RecordsRepositoryStub(live_records)
+    loader.skins_repository = SkinsRepositoryStub({skin_uuid})
+
+    history = [now - timedelta(days=30) + timedelta(hours=hour) for hour in range(48)]
+    parsed = [(uuid4(), registered_at, skin_uuid, Decimal(1), 1) for registered_at in history]
+    copy_rows = asyncio.run(loader.get_copy_rows(None, parsed))
+
+    labels = [mask_to_labels(row[5]) for row in copy_rows]
+    assert labels[0] == list(LABEL_BITS)
+    assert sum('year' in row_labels for row_labels in labels) == 2
+    assert all('day' in row_labels for row_labels in labels)
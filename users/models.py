@@ -2,21 +2,23 @@ from uuid import uuid4
 from datetime import datetime
 from json import loads
 
-from sqlalchemy import TIMESTAMP, Column, String, Uuid
+from sqlalchemy import TIMESTAMP, Column, String, Uuid, Integer
 
 from utils.database import Base
 
-from users.schemas import UserRead, UserWithPassword
+from users.schemas import UserRead, UserWithPassword, UserWithTokenVersion
 
 
 class User(Base):
     __tablename__ = 'user'
 
     uuid = Column(Uuid, primary_key=True, default=uuid4)
-    username = Column(String, nullable=False)
+    username = Column(String, nullable=False, unique=True, index=True)
     subscribed_at = Column(TIMESTAMP, default=datetime.utcnow)
     roles = Column(String)
     hashed_password: str = Column(String(length=1024), nullable=False)
+    # Меняется при смене пароля, ролей и удалении, чтобы выданные ранее токены перестали действовать
+    token_version = Column(Integer, nullable=False, default=0, server_default='0')
 
     def to_read_model(self):
         return UserRead(
@@ -32,5 +34,15 @@ class User(Base):
             username=self.username,
             hashed_password=self.hashed_password,
             subscribed_at=self.subscribed_at,
-            roles=loads(self.roles)
+            roles=loads(self.roles),
+            token_version=self.token_version
+        )
+
+    def to_with_token_version_model(self):
+        return UserWithTokenVersion(
+            uuid=self.uuid,
+            username=self.username,
+            subscribed_at=self.subscribed_at,
+            roles=loads(self.roles),
+            token_version=self.token_version
         )
@@ -1,4 +1,6 @@
-from sqlalchemy import select, and_
+from uuid import UUID
+
+from sqlalchemy import case
 
 from utils.repository import SQLAlchemyRepository
 
@@ -8,25 +10,29 @@ from users.models import User
 class UsersRepository(SQLAlchemyRepository):
     model = User
 
-    async def find_all_with_passwords(self, session, filter_dict: dict = None, **filter_by):
-        stmt = select(self.model).filter_by(**filter_by)
-
-        if filter_dict:
-            for key, val in filter_dict.items():
-                if key in self.model.__dict__:
-                    if val[0] == 'between':
-                        stmt = stmt.filter(and_(self.model.__dict__[key] >= val[1],
-                                                self.model.__dict__[key] <= val[2]))
-
-        res = await session.execute(stmt)
-        res = [row[0].to_with_password_model() for row in res.all()]
-        return res
-
     async def find_one_with_password(self, session, filter_dict: dict = None, **filter_by):
-        stmt = select(self.model).filter_by(**filter_by).limit(2)
-        res = await session.execute(stmt)
-        res = [row[0].to_with_password_model() for row in res.all()]
-        if res:
-            return res[0]
-        else:
+        res = await self._select(session, filter_dict, filter_by, limit=2)
+        res = res.scalars().first()
+        return res.to_with_password_model() if res else None
+
+    async def find_one_by_username(self, session, username: str, with_password: bool = False):
+        # Уникальный индекс по username: не больше одной строки
+        res = await self._select(session, None, {'username': username}, limit=1)
+        res = res.scalars().first()
+        if not res:
             return None
+        return res.to_with_password_model() if with_password else res.to_read_model()
+
+    async def find_one_with_token_version(self, session, uuid: UUID):
+        res = await session.get(self.model, uuid)
+        return res.to_with_token_version_model() if res else None
+
+    def next_token_version(self, roles: str | None = None):
+        """
+        Function that returns SQL expression of the next token version.
+        :param roles: new roles of the user; if given, the version changes only when the roles change
+        """
+        if roles is None:
+            return self.model.token_version + 1
+        return case((self.model.roles.is_distinct_from(roles), self.model.token_version + 1),
+                    else_=self.model.token_version)
@@ -1,19 +1,20 @@
+from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter
-from fastapi_cache.decorator import cache
-from fastapi_cache import FastAPICache
-
-from utils.logic import equal_uuids, check_password
+from fastapi import APIRouter, Depends
+from utils.logic import equal_uuids, validate_limit, DEFAULT_PAGE_LIMIT
+from utils.passwords import check_password_async
 from utils.exceptions import exception_handler
+from utils.cache import cached, invalidate_tags
 from utils.dependency import (UsersServiceDep,
-                              AuthenticationServiceDep,
                               InventoryServiceDep,
                               RolesServiceDep,
-                              AuthenticationDep,
+                              AuthorDep,
+                              Requires,
                               UOWDep)
 
-from authentication.exceptions import NotAuthenticatedError, IncorrectCredentialsError
+from authentication.exceptions import IncorrectCredentialsError
+from authentication.schemas import Principal
 from roles.exceptions import RoleNotFoundError
 
 from users.schemas import UserCreate, UserUpdate, ChangePassword
@@ -22,22 +23,28 @@ from users.logic import validate_username, validate_password
 
 router = APIRouter(prefix='/users', tags=['Users'])
 
+InsertUsersDep = Annotated[Principal, Depends(Requires('insert_users', InsertUserDenied))]
+
 
 @router.get('')
-@cache(namespace='users', expire=3600)
+@cached(namespace='users', expire=3600, tags=['users'])
 @exception_handler
 async def get_users_handler(users_service: UsersServiceDep,
                             uow: UOWDep,
-                            username: str | None = None):
-    users = await users_service.get_users(uow, username=username)
+                            username: str | None = None,
+                            limit: int = DEFAULT_PAGE_LIMIT,
+                            cursor: str | None = None):
+    validate_limit(limit)
+    users, next_cursor = await users_service.get_users_page(uow, limit, cursor, username=username)
     return {
         'data': users,
+        'next_cursor': next_cursor,
         'detail': 'Users were selected.'
     }
 
 
 @router.get('/{uuid}')
-@cache(namespace='users', expire=3600)
+@cached(namespace='users', expire=3600, tags=['user:{uuid}'])
 @exception_handler
 async def get_user_handler(users_service: UsersServiceDep,
                            uow: UOWDep,
@@ -55,33 +62,23 @@ async def get_user_handler(users_service: UsersServiceDep,
 @router.post('/')
 @exception_handler
 async def post_users_handler(users_service: UsersServiceDep,
-                             authentication_service: AuthenticationServiceDep,
                              roles_service: RolesServiceDep,
                              uow: UOWDep,
-                             user: UserCreate,
-                             authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                             author: InsertUsersDep,
+                             user: UserCreate):
     validate_username(user.username)
     validate_password(user.password)
 
-    users_with_same_usernames = await users_service.get_users(uow, username=user.username)
-    if users_with_same_usernames:
+    user_with_same_username = await users_service.get_user_by_username(uow, user.username)
+    if user_with_same_username:
         raise UsernameTakenError
 
-    can_insert = await roles_service.has_permission(uow, author, 'insert_users')
-    if not can_insert:
-        raise InsertUserDenied
-
     fake_role = await roles_service.get_fake_role(uow, user.roles)
     if fake_role:
         raise RoleNotFoundError
 
     await users_service.add_user(uow, user)
-    await FastAPICache.clear(namespace='users')
-    await FastAPICache.clear(namespace='inventory')
+    await invalidate_tags('users')
     return {
         'data': None,
         'detail': 'User was added.'
@@ -91,26 +88,21 @@ async def post_users_handler(users_service: UsersServiceDep,
 @router.put('/{uuid}')
 @exception_handler
 async def put_users_handler(users_service: UsersServiceDep,
-                            authentication_service: AuthenticationServiceDep,
                             roles_service: RolesServiceDep,
                             uow: UOWDep,
+                            author: AuthorDep,
                             uuid: UUID,
-                            user: UserUpdate,
-                            authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                            user: UserUpdate):
     validate_username(user.username)
 
     can_update = False
-    if not equal_uuids(author.uuid, uuid):
-        can_update = await roles_service.has_permission(uow, author, 'update_users')
+    if not equal_uuids(author.user.uuid, uuid):
+        can_update = author.has_permission('update_users')
         if not can_update:
             raise UpdateUserDenied
 
-    users_with_new_username = await users_service.get_users(uow, username=user.username)
-    if users_with_new_username and not equal_uuids(users_with_new_username[0].uuid, uuid):
+    user_with_new_username = await users_service.get_user_by_username(uow, user.username)
+    if user_with_new_username and not equal_uuids(user_with_new_username.uuid, uuid):
         raise UsernameTakenError
 
     if can_update:
@@ -121,8 +113,7 @@ async def put_users_handler(users_service: UsersServiceDep,
         await users_service.update_user(uow, uuid, user, full_update=True)
     else:
         await users_service.update_user(uow, uuid, user)
-    await FastAPICache.clear(namespace='users')
-    await FastAPICache.clear(namespace='inventory')
+    await invalidate_tags('users', f'user:{uuid}')
     return {
         'data': None,
         'detail': 'User was updated.'
@@ -132,16 +123,11 @@ async def put_users_handler(users_service: UsersServiceDep,
 @router.put('/{uuid}/password')
 @exception_handler
 async def put_users_password_handler(users_service: UsersServiceDep,
-                                     authentication_service: AuthenticationServiceDep,
                                      uow: UOWDep,
+                                     author: AuthorDep,
                                      uuid: UUID,
-                                     change_password: ChangePassword,
-                                     authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
-    if not equal_uuids(author.uuid, uuid):
+                                     change_password: ChangePassword):
+    if not equal_uuids(author.user.uuid, uuid):
         raise ChangePasswordDenied
 
     validate_password(change_password.new_password)
@@ -150,12 +136,10 @@ async def put_users_password_handler(users_service: UsersServiceDep,
     if not user_with_this_uuid:
         raise UserNotFoundError
 
-    if not check_password(change_password.current_password, user_with_this_uuid.hashed_password):
+    if not await check_password_async(change_password.current_password, user_with_this_uuid.hashed_password):
         raise IncorrectCredentialsError
 
     await users_service.change_password(uow, uuid, change_password)
-    await FastAPICache.clear(namespace='users')
-    await FastAPICache.clear(namespace='inventory')
     return {
         'data': None,
         'detail': 'Password was changed.'
@@ -165,29 +149,22 @@ async def put_users_password_handler(users_service: UsersServiceDep,
 @router.delete('/{uuid}')
 @exception_handler
 async def delete_user_handler(users_service: UsersServiceDep,
-                              authentication_service: AuthenticationServiceDep,
-                              roles_service: RolesServiceDep,
                               inventory_service: InventoryServiceDep,
                               uow: UOWDep,
-                              uuid: UUID,
-                              authorization: AuthenticationDep = None):
-    author = await authentication_service.authenticated_user(uow, authorization)
-    if not author:
-        raise NotAuthenticatedError
-
+                              author: AuthorDep,
+                              uuid: UUID):
     user_with_this_uuid = await users_service.get_user(uow, uuid)
     if not user_with_this_uuid:
         raise UserNotFoundError
 
-    if not equal_uuids(author.uuid, user_with_this_uuid.uuid):
-        can_delete = await roles_service.has_permission(uow, author, 'delete_users')
-        if not can_delete:
+    if not equal_uuids(author.user.uuid, user_with_this_uuid.uuid):
+        if not author.has_permission('delete_users'):
             raise DeleteUserDenied
 
-    await inventory_service.delete_inventory_items(uow, user_with_this_uuid.uuid)
-    await users_service.delete_user(uow, user_with_this_uuid.uuid)
-    await FastAPICache.clear(namespace='users')
-    await FastAPICache.clear(namespace='inventory')
+    async with uow.transaction():
+        await inventory_service.delete_inventory_items(uow, user_with_this_uuid.uuid)
+        await users_service.delete_user(uow, user_with_this_uuid.uuid)
+    await invalidate_tags('users', f'user:{uuid}', 'inventory', f'user-inventory:{uuid}')
     return {
         'data': None,
         'detail': 'User was deleted.'
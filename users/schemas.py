@@ -13,6 +13,10 @@ class UserRead(BaseModel):
         from_attributes = True
 
 
+class UserWithTokenVersion(UserRead):
+    token_version: int
+
+
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -32,6 +36,7 @@ class UserWithPassword(BaseModel):
     hashed_password: str
     subscribed_at: datetime
     roles: list[UUID]
+    token_version: int = 0
 
     class Config:
         from_attributes = True
@@ -1,25 +1,28 @@
 from json import dumps
 from uuid import UUID, uuid4
 
+from sqlalchemy.exc import IntegrityError
+
 from utils.unitofwork import IUnitOfWork
-from utils.logic import hash_password
+from utils.passwords import hash_password_async
+from utils.ttl_cache import TTLCache
 
 from users.repository import UsersRepository
 from users.schemas import UserCreate, UserUpdate, ChangePassword
+from users.exceptions import UsernameTakenError
 
 
 class UsersService:
-    def __init__(self, users_repository: UsersRepository):
+    def __init__(self, users_repository: UsersRepository, users_cache: TTLCache):
         self.users_repository = users_repository
+        self.users_cache = users_cache
 
-    async def get_users(self, uow: IUnitOfWork, username: str | None = None, with_password: bool = False):
+    async def get_users_page(self, uow: IUnitOfWork, limit: int, cursor: str | None = None,
+                             username: str | None = None):
         async with uow:
             filter_by_dict = {'username': username} if username else {}
-            if with_password:
-                users = await self.users_repository.find_all_with_passwords(uow.session, **filter_by_dict)
-            else:
-                users = await self.users_repository.find_all(uow.session, **filter_by_dict)
-            return users
+            users, next_cursor = await self.users_repository.find_page(uow.session, limit, cursor, **filter_by_dict)
+            return users, next_cursor
 
     async def get_user(self, uow: IUnitOfWork, uuid: UUID, with_password: bool = False):
         async with uow:
@@ -29,16 +32,27 @@ class UsersService:
                 user = await self.users_repository.find_one(uow.session, uuid=uuid)
             return user
 
+    async def get_user_by_username(self, uow: IUnitOfWork, username: str, with_password: bool = False):
+        async with uow:
+            user = await self.users_repository.find_one_by_username(uow.session, username, with_password)
+            return user
+
     async def add_user(self, uow: IUnitOfWork, user: UserCreate):
+        # Хеш считается в отдельном пуле потоков до начала записи
+        hashed_password = await hash_password_async(user.password)
         async with uow:
             user_dict = {
                 'uuid': uuid4(),
                 'username': user.username,
                 'subscribed_at': user.subscribed_at.replace(tzinfo=None),
                 'roles': dumps([str(role_uuid) for role_uuid in user.roles]),
-                'hashed_password': hash_password(user.password)
+                'hashed_password': hashed_password
             }
-            await self.users_repository.add_one(uow.session, user_dict)
+            try:
+                await self.users_repository.add_one(uow.session, user_dict)
+            except IntegrityError:
+                # Проверка имени в обработчике не защищает от одновременной регистрации двух одинаковых имён
+                raise UsernameTakenError
             await uow.commit()
 
     async def update_user(self, uow: IUnitOfWork, uuid: UUID, user: UserUpdate, full_update: bool = False):
@@ -49,17 +63,31 @@ class UsersService:
             if full_update:
                 user_dict['subscribed_at'] = user.subscribed_at.replace(tzinfo=None)
                 user_dict['roles'] = dumps([str(role_uuid) for role_uuid in user.roles])
-            await self.users_repository.edit_one(uow.session, uuid, user_dict)
+                # Смена ролей отзывает выданные токены
+                user_dict['token_version'] = self.users_repository.next_token_version(user_dict['roles'])
+            try:
+                await self.users_repository.edit_one(uow.session, uuid, user_dict)
+            except IntegrityError:
+                raise UsernameTakenError
             await uow.commit()
+        self._evict(uuid)
 
     async def change_password(self, uow: IUnitOfWork, uuid: UUID, change_password: ChangePassword):
+        hashed_password = await hash_password_async(change_password.new_password)
         async with uow:
             await self.users_repository.edit_one(uow.session, uuid, {
-                'hashed_password': hash_password(change_password.new_password)
+                'hashed_password': hashed_password,
+                'token_version': self.users_repository.next_token_version()
             })
             await uow.commit()
+        self._evict(uuid)
 
     async def delete_user(self, uow: IUnitOfWork, uuid: UUID):
         async with uow:
             await self.users_repository.delete_one(uow.session, uuid)
             await uow.commit()
+        self._evict(uuid)
+
+    def _evict(self, uuid: UUID):
+        # Другие воркеры увидят изменения, когда истечёт срок записи в их кеше
+        self.users_cache.evict(lambda key: key[0] == uuid)
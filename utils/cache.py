@@ -0,0 +1,153 @@
+import inspect
+from functools import wraps
+from hashlib import sha1
+from typing import Callable, Iterable
+from urllib.parse import urlencode
+
+from fastapi import Request
+from fastapi_cache.coder import JsonCoder
+from redis.exceptions import RedisError
+
+from utils.redis import redis
+
+from authentication.schemas import Principal
+
+CACHE_PREFIX = 'tradeoverseer-api-cache'
+CACHE_KEY = CACHE_PREFIX + ':{}:{}'
+TAG_KEY = CACHE_PREFIX + ':tag:{}'
+# Номер последней инвалидации тега и общий счётчик инвалидаций
+TAG_SEQUENCE_KEY = CACHE_PREFIX + ':tag-sequence:{}'
+SEQUENCE_KEY = CACHE_PREFIX + ':sequence'
+# Должен быть больше времени обработки любого запроса
+TAG_SEQUENCE_EXPIRE = 24 * 60 * 60
+
+# Удаляет все записи с данными тегами вместе с самими множествами тегов и запоминает номер инвалидации тегов.
+# KEYS: счётчик, затем пары (множество тега, номер тега). ARGV: время жизни номеров.
+INVALIDATE_TAGS_SCRIPT = '''
+local sequence = redis.call('INCR', KEYS[1])
+for i = 2, #KEYS, 2 do
+    local keys = redis.call('SMEMBERS', KEYS[i])
+    for j = 1, #keys do
+        redis.call('DEL', keys[j])
+    end
+    redis.call('DEL', KEYS[i])
+    redis.call('SET', KEYS[i + 1], sequence, 'EX', ARGV[1])
+end
+return sequence
+'''
+
+# Сохраняет запись, только если ни один её тег не инвалидировался после начала запроса:
+# иначе ответ мог быть прочитан из базы до изменения и остался бы в кеше до истечения срока.
+# KEYS: запись, затем пары (множество тега, номер тега). ARGV: значение, время жизни, номер на начало запроса.
+STORE_SCRIPT = '''
+for i = 2, #KEYS, 2 do
+    if tonumber(redis.call('GET', KEYS[i + 1]) or '0') > tonumber(ARGV[3]) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+for i = 2, #KEYS, 2 do
+    redis.call('SADD', KEYS[i], KEYS[1])
+    redis.call('EXPIRE', KEYS[i], ARGV[2])
+end
+return 1
+'''
+
+invalidate_tags_script = redis.register_script(INVALIDATE_TAGS_SCRIPT)
+store_script = redis.register_script(STORE_SCRIPT)
+
+
+def get_tag_keys(tags: Iterable[str]) -> list[str]:
+    keys = list()
+    for tag in tags:
+        keys.extend([TAG_KEY.format(tag), TAG_SEQUENCE_KEY.format(tag)])
+    return keys
+
+
+def get_principal_key(principal: Principal) -> str:
+    permissions = sha1(','.join(sorted(principal.permissions)).encode()).hexdigest()[:12]
+    return f'{principal.user.uuid}:{permissions}'
+
+
+def get_cache_key(namespace: str, request: Request, principal: Principal | None = None) -> str:
+    """
+    Function that builds the cache key of a request.
+    :param namespace: namespace of the handler
+    :param request: request
+    :param principal: author of the request, if the response depends on them
+    :return: key with the path, sorted query parameters and the principal
+    """
+    query = urlencode(sorted(request.query_params.multi_items()))
+    key = f'{request.url.path}?{query}'
+    if principal is not None:
+        key = f'{key}#{get_principal_key(principal)}'
+    return CACHE_KEY.format(namespace, key)
+
+
+def cached(namespace: str, expire: int, tags: Iterable[str] | Callable[..., Iterable[str]] = (),
+           per_principal: bool = False):
+    """
+    Decorator that caches responses of a GET handler in Redis.
+
+    Access is checked by dependencies before the handler is called, so by default an entry is shared
+    by everyone who may call the handler. Handlers whose response depends on the author pass per_principal,
+    then the key includes the author's uuid and permissions.
+
+    Tags are format strings filled with the handler arguments and its result, e.g. 'skin:{uuid}' or
+    'user:{result[data].user_uuid}', or a function tags(result, **kwargs) returning them.
+    invalidate_tags removes all entries marked with any of the given tags. A response is not stored
+    if any of its tags was invalidated while it was being computed.
+    """
+
+    def wrapper(handler):
+        signature = inspect.signature(handler)
+
+        @wraps(handler)
+        async def inner(*args, cache_request: Request, **kwargs):
+            if cache_request.headers.get('Cache-Control') in ('no-store', 'no-cache'):
+                return await handler(*args, **kwargs)
+
+            principal = None
+            if per_principal:
+                principal = next(value for value in kwargs.values() if isinstance(value, Principal))
+            key = get_cache_key(namespace, cache_request, principal)
+
+            try:
+                value, sequence = await redis.mget(key, SEQUENCE_KEY)
+            except RedisError:
+                # Без номера на начало запроса нельзя проверить, что ответ не устарел, поэтому он не сохраняется
+                return await handler(*args, **kwargs)
+            if value is not None:
+                return JsonCoder.decode(value)
+
+            res = await handler(*args, **kwargs)
+            if callable(tags):
+                entry_tags = list(tags(res, **kwargs))
+            else:
+                entry_tags = [tag.format(**kwargs, result=res) for tag in tags]
+            try:
+                await store_script(keys=[key, *get_tag_keys(entry_tags)],
+                                   args=[JsonCoder.encode(res), expire, int(sequence or 0)])
+            except RedisError:
+                pass
+            return res
+
+        # FastAPI передаст запрос в cache_request, остальные параметры остаются как у обработчика
+        inner.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter('cache_request', inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+        ])
+        return inner
+
+    return wrapper
+
+
+async def invalidate_tags(*tags: str):
+    """
+    Function that removes cached responses marked with any of the given tags.
+    If Redis is unavailable, the entries expire on their own.
+    """
+    try:
+        await invalidate_tags_script(keys=[SEQUENCE_KEY, *get_tag_keys(tags)], args=[TAG_SEQUENCE_EXPIRE])
+    except RedisError:
+        pass
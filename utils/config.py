@@ -8,11 +8,33 @@ DB_NAME = os.environ.get('DB_NAME')
 DB_USER = os.environ.get('DB_USER')
 DB_PASS = os.environ.get('DB_PASS')
 DB_URL = f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').strip().lower() == 'true'
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 100))
+DB_POOL_WARMUP_SIZE = int(os.environ.get('DB_POOL_WARMUP_SIZE', min(DB_POOL_SIZE, 2)))
+DB_REPLICA_URLS = [url.strip() for url in os.environ.get('DB_REPLICA_URLS', '').split(';') if url.strip()]
+DB_REPLICA_COOLDOWN = float(os.environ.get('DB_REPLICA_COOLDOWN', 30))
+DB_REPLICA_CONNECT_TIMEOUT = float(os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', 2))
+
+SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 10))
 
 REDIS_HOST = os.environ.get('REDIS_HOST')
 REDIS_PORT = os.environ.get('REDIS_PORT')
+REDIS_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}'
+
+READINESS_TIMEOUT = float(os.environ.get('READINESS_TIMEOUT', 2))
 
 AUTH_SECRET = os.environ.get('AUTH_SECRET')
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 10000))
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', 30))
+PERMISSION_INDEX_MAX_AGE = float(os.environ.get('PERMISSION_INDEX_MAX_AGE', 60))
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', min(4, os.cpu_count() or 1)))
+BCRYPT_QUEUE_SIZE = int(os.environ.get('BCRYPT_QUEUE_SIZE', 16))
 
 INSERT_ACCESS_KEY = os.environ.get('INSERT_ACCESS_KEY')
 
@@ -1,20 +1,176 @@
+import asyncio
+from itertools import count
+from time import perf_counter, monotonic
 from typing import AsyncGenerator
 
-from sqlalchemy import MetaData
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import MetaData, event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from utils.config import DB_URL
+from utils.config import (DB_URL,
+                          DB_POOL_SIZE,
+                          DB_MAX_OVERFLOW,
+                          DB_POOL_TIMEOUT,
+                          DB_POOL_RECYCLE,
+                          DB_POOL_PRE_PING,
+                          DB_STATEMENT_CACHE_SIZE,
+                          DB_POOL_WARMUP_SIZE,
+                          DB_REPLICA_URLS,
+                          DB_REPLICA_COOLDOWN,
+                          DB_REPLICA_CONNECT_TIMEOUT)
 
 Base = declarative_base()
 
 metadata = MetaData()
 
-engine = create_async_engine(DB_URL, poolclass=NullPool)
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Connection pool that counts requests waiting for a connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+
+    def _do_get(self):
+        self.waiting += 1
+        try:
+            return super()._do_get()
+        finally:
+            self.waiting -= 1
+
+
+class ConnectMetrics:
+    def __init__(self):
+        self.connects = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def add(self, connect_time: float):
+        self.connects += 1
+        self.total_time += connect_time
+        self.max_time = max(self.max_time, connect_time)
+
+
+def create_engine(url: str, connect_timeout: float | None = None) -> AsyncEngine:
+    connect_args = {
+        'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+        'prepared_statement_cache_size': DB_STATEMENT_CACHE_SIZE
+    }
+    if connect_timeout is not None:
+        connect_args['timeout'] = connect_timeout
+    new_engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args
+    )
+    connect_metrics = new_engine.sync_engine.connect_metrics = ConnectMetrics()
+
+    @event.listens_for(new_engine.sync_engine, 'do_connect')
+    def on_connect_started(dialect, connection_record, cargs, cparams):
+        connection_record.info['connect_started_at'] = perf_counter()
+
+    @event.listens_for(new_engine.sync_engine, 'connect')
+    def on_connect_finished(dbapi_connection, connection_record):
+        started_at = connection_record.info.pop('connect_started_at', None)
+        if started_at is not None:
+            connect_metrics.add(perf_counter() - started_at)
+
+    return new_engine
+
+
+class ReplicaRouter:
+    """
+    Round-robin over read replicas. A replica that failed a health check is skipped for the cooldown period.
+    """
+
+    def __init__(self, engines: list[AsyncEngine], cooldown: float):
+        self.engines = engines
+        self.cooldown = cooldown
+        self.position = count()
+        self.failed_until: dict[AsyncEngine, float] = dict()
+
+    def get_engine(self) -> AsyncEngine | None:
+        now = monotonic()
+        for _ in range(len(self.engines)):
+            replica_engine = self.engines[next(self.position) % len(self.engines)]
+            if self.failed_until.get(replica_engine, 0) <= now:
+                return replica_engine
+        return None
+
+    def mark_failed(self, replica_engine: AsyncEngine):
+        self.failed_until[replica_engine] = monotonic() + self.cooldown
+
+    def is_healthy(self, replica_engine: AsyncEngine) -> bool:
+        return self.failed_until.get(replica_engine, 0) <= monotonic()
+
+
+engine = create_engine(DB_URL)
+# Недоступная реплика должна быстро уступать место primary, а не ждать стандартный таймаут подключения
+replica_engines = [create_engine(url, DB_REPLICA_CONNECT_TIMEOUT) for url in DB_REPLICA_URLS]
+replica_router = ReplicaRouter(replica_engines, DB_REPLICA_COOLDOWN)
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+pool_warmed_up = False
+
+
+async def warm_up_pool(size: int = DB_POOL_WARMUP_SIZE):
+    """
+    Function that opens pool connections in advance, so that first requests do not pay for connecting.
+    """
+    global pool_warmed_up
+    connections = await asyncio.gather(*[engine.connect() for _ in range(size)], return_exceptions=True)
+    for connection in connections:
+        if not isinstance(connection, BaseException):
+            await connection.close()
+    for connection in connections:
+        if isinstance(connection, BaseException):
+            raise connection
+    pool_warmed_up = True
+
+
+async def check_database():
+    if not pool_warmed_up:
+        await warm_up_pool()
+    async with engine.connect() as connection:
+        await connection.execute(text('SELECT 1'))
+
+
+def get_engine_pool_stats(stats_engine: AsyncEngine):
+    pool = stats_engine.pool
+    connect_metrics = stats_engine.sync_engine.connect_metrics
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'waiting': pool.waiting,
+        'connects': connect_metrics.connects,
+        'connect_time_avg_ms': (connect_metrics.total_time / connect_metrics.connects * 1000
+                                if connect_metrics.connects else None),
+        'connect_time_max_ms': connect_metrics.max_time * 1000
+    }
+
+
+def get_pool_stats():
+    return {
+        'primary': get_engine_pool_stats(engine),
+        'replicas': [{
+            'host': replica_engine.url.host,
+            'port': replica_engine.url.port,
+            'healthy': replica_router.is_healthy(replica_engine),
+            **get_engine_pool_stats(replica_engine)
+        } for replica_engine in replica_engines]
+    }
+
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
@@ -1,9 +1,11 @@
 from typing import Annotated
 from datetime import datetime
 
-from fastapi import Depends, Header, File, Form
+from fastapi import Depends, Header, File, Form, Request
 
 from authentication.service import AuthenticationService
+from authentication.schemas import Principal
+from authentication.exceptions import NotAuthenticatedError
 
 from roles.repository import RolesRepository
 from roles.service import RolesService
@@ -11,7 +13,10 @@ from roles.service import RolesService
 from users.repository import UsersRepository
 from users.service import UsersService
 
-from records.repository import RecordsRepository
+from records.repository import (RecordsRepository,
+                                RealtimeRecordsRepository,
+                                HourRollupsRepository,
+                                DayRollupsRepository)
 from records.service import RecordsService
 
 from skins.repository import SkinsRepository
@@ -26,6 +31,9 @@ from rarities.service import RaritiesService
 from orders.service import OrdersService
 
 from utils.unitofwork import IUnitOfWork, UnitOfWork
+from utils.exceptions import get_http_exception
+from utils.ttl_cache import TTLCache
+from utils.config import AUTH_CACHE_SIZE, AUTH_CACHE_TTL
 
 roles_repository = RolesRepository()
 roles_service = RolesService(roles_repository)
@@ -34,12 +42,17 @@ inventory_repository = InventoryRepository()
 inventory_service = InventoryService(inventory_repository)
 
 users_repository = UsersRepository()
-users_service = UsersService(users_repository)
+users_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+users_service = UsersService(users_repository, users_cache)
 
-authentication_service = AuthenticationService(users_service)
+authentication_service = AuthenticationService(users_repository, users_cache)
 
 records_repository = RecordsRepository()
-records_service = RecordsService(records_repository)
+realtime_records_repository = RealtimeRecordsRepository()
+hour_rollups_repository = HourRollupsRepository()
+day_rollups_repository = DayRollupsRepository()
+records_service = RecordsService(records_repository, realtime_records_repository,
+                                 hour_rollups_repository, day_rollups_repository)
 
 skins_repository = SkinsRepository()
 skins_service = SkinsService(skins_repository)
@@ -50,6 +63,17 @@ rarities_service = RaritiesService(rarities_repository)
 orders_service = OrdersService()
 
 
+READ_ONLY_METHODS = ('GET', 'HEAD')
+
+
+async def get_uow(request: Request):
+    # Сессия живёт до конца запроса и общая для всех сервисов обработчика.
+    # Читающие запросы идут на реплики, остальные на primary, чтобы видеть свои же записи
+    uow = UnitOfWork(read_only=request.method in READ_ONLY_METHODS)
+    async with uow:
+        yield uow
+
+
 async def get_users_service():
     return users_service
 
@@ -91,8 +115,51 @@ RolesServiceDep = Annotated[RolesService, Depends(get_roles_service)]
 RaritiesServiceDep = Annotated[RaritiesService, Depends(get_rarities_service)]
 OrdersServiceDep = Annotated[OrdersService, Depends(get_orders_service)]
 
-UOWDep = Annotated[IUnitOfWork, Depends(UnitOfWork)]
+UOWDep = Annotated[IUnitOfWork, Depends(get_uow)]
 AuthenticationDep = Annotated[str | None, Header()]
 InsertAccessKeyDep = Annotated[str | None, Header()]
+AcceptDep = Annotated[str | None, Header()]
+IfNoneMatchDep = Annotated[str | None, Header()]
 FileDep = Annotated[bytes, File()]
 DatetimeFormDep = Annotated[datetime, Form()]
+
+
+async def get_principal(authentication_service: AuthenticationServiceDep,
+                        roles_service: RolesServiceDep,
+                        uow: UOWDep,
+                        authorization: AuthenticationDep = None) -> Principal | None:
+    # FastAPI кеширует зависимость в рамках запроса, поэтому автор и его права вычисляются один раз
+    try:
+        user = await authentication_service.authenticated_user(uow, authorization)
+        if not user:
+            return None
+        permissions = await roles_service.get_permissions(uow, user.roles)
+    except Exception as ex:
+        raise get_http_exception(ex)
+    return Principal(user=user, permissions=permissions)
+
+
+async def get_author(principal: Annotated[Principal | None, Depends(get_principal)]) -> Principal:
+    if principal is None:
+        raise get_http_exception(NotAuthenticatedError())
+    return principal
+
+
+class Requires:
+    """
+    Dependency that returns the author of the request if they have the permission.
+    Usage: author: Annotated[Principal, Depends(Requires('read_skins', ReadSkinDenied))]
+    """
+
+    def __init__(self, permission: str, denied_error: type[PermissionError]):
+        self.permission = permission
+        self.denied_error = denied_error
+
+    async def __call__(self, author: Annotated[Principal, Depends(get_author)]) -> Principal:
+        if not author.has_permission(self.permission):
+            raise get_http_exception(self.denied_error())
+        return author
+
+
+PrincipalDep = Annotated[Principal | None, Depends(get_principal)]
+AuthorDep = Annotated[Principal, Depends(get_author)]
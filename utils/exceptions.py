@@ -13,35 +13,46 @@ class ExistsError(BaseException):
     pass
 
 
+class OverloadedError(BaseException):
+    def __str__(self):
+        return 'Server is overloaded. Try again later.'
+
+
+class ReadMetricsDenied(PermissionError):
+    def __str__(self):
+        return 'Author does not have read_metrics permission.'
+
+
+def get_http_exception(ex: BaseException) -> HTTPException:
+    """
+    Function that converts an exception of the API into the HTTP error returned to the client.
+    """
+    if isinstance(ex, HTTPException):
+        return ex
+    if isinstance(ex, (ValueError, ExistsError)):
+        status_code, headers = 400, None
+    elif isinstance(ex, AuthenticationError):
+        status_code, headers = 401, None
+    elif isinstance(ex, PermissionError):
+        status_code, headers = 403, None
+    elif isinstance(ex, NotFoundError):
+        status_code, headers = 404, None
+    elif isinstance(ex, OverloadedError):
+        status_code, headers = 503, {'Retry-After': '1'}
+    else:
+        status_code, headers = 500, None
+    return HTTPException(status_code, detail={
+        'data': None,
+        'detail': str(ex)
+    }, headers=headers)
+
+
 def exception_handler(handler):
     async def wrapper(*args, **kwargs):
         try:
             res = await handler(*args, **kwargs)
-        except (ValueError, ExistsError) as ex:
-            raise HTTPException(400, detail={
-                'data': None,
-                'detail': str(ex)
-            })
-        except AuthenticationError as ex:
-            raise HTTPException(401, detail={
-                'data': None,
-                'detail': str(ex)
-            })
-        except PermissionError as ex:
-            raise HTTPException(403, detail={
-                'data': None,
-                'detail': str(ex)
-            })
-        except NotFoundError as ex:
-            raise HTTPException(404, detail={
-                'data': None,
-                'detail': str(ex)
-            })
-        except Exception as ex:
-            raise HTTPException(500, detail={
-                'data': None,
-                'detail': str(ex)
-            })
+        except (Exception, NotFoundError, AuthenticationError, ExistsError, OverloadedError) as ex:
+            raise get_http_exception(ex)
         else:
             return res
 
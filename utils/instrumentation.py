@@ -0,0 +1,127 @@
+import logging
+import re
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+from utils.config import SQL_N_PLUS_ONE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+PARAM_PATTERN = re.compile(r'\$\d+')
+PARAM_LIST_PATTERN = re.compile(r'\?(, \?)+')
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+
+    def add(self, statement: str, query_time: float):
+        self.queries += 1
+        self.db_time += query_time
+
+        shape = get_statement_shape(statement)
+        self.shapes[shape] += 1
+        # Предупреждение выдаётся один раз на форму запроса, когда порог только что превышен
+        if SQL_N_PLUS_ONE_THRESHOLD and self.shapes[shape] == SQL_N_PLUS_ONE_THRESHOLD + 1:
+            logger.warning('Possible N+1: statement was executed more than %d times in one request: %s',
+                           SQL_N_PLUS_ONE_THRESHOLD, shape)
+
+
+class RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.max_db_time = 0.0
+
+    def add(self, stats: RequestStats):
+        self.requests += 1
+        self.queries += stats.queries
+        self.max_queries = max(self.max_queries, stats.queries)
+        self.db_time += stats.db_time
+        self.max_db_time = max(self.max_db_time, stats.db_time)
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'queries_avg': self.queries / self.requests if self.requests else None,
+            'queries_max': self.max_queries,
+            'db_time_avg_ms': self.db_time / self.requests * 1000 if self.requests else None,
+            'db_time_max_ms': self.max_db_time * 1000
+        }
+
+
+request_stats: ContextVar[RequestStats | None] = ContextVar('request_stats', default=None)
+route_stats: dict[str, RouteStats] = dict()
+
+
+def get_statement_shape(statement: str) -> str:
+    # Значения параметров и длина списков IN не влияют на форму запроса
+    return PARAM_LIST_PATTERN.sub('?', PARAM_PATTERN.sub('?', ' '.join(statement.split())))
+
+
+def get_route_path(app, scope) -> str:
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+def get_server_timing(stats: RequestStats) -> str:
+    return f'db;desc="{stats.queries} queries";dur={stats.db_time * 1000:.2f}'
+
+
+def get_sql_stats():
+    return {route: stats.to_dict() for route, stats in sorted(route_stats.items())}
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def on_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', list()).append(perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def on_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info['query_started_at'].pop()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.add(statement, perf_counter() - started_at)
+
+
+@event.listens_for(Engine, 'handle_error')
+def on_handle_error(exception_context):
+    # after_cursor_execute не вызывается при ошибке, иначе время запуска осталось бы в соединении пула навсегда
+    conn = exception_context.connection
+    if exception_context.statement is None or conn is None or not conn.info.get('query_started_at'):
+        return
+    started_at = conn.info['query_started_at'].pop()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.add(exception_context.statement, perf_counter() - started_at)
+
+
+async def sql_instrumentation_middleware(request, call_next):
+    """
+    Middleware that counts queries and database time of every request.
+    The totals are returned in the Server-Timing header and aggregated per route.
+    """
+    stats = RequestStats()
+    token = request_stats.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        request_stats.reset(token)
+
+    response.headers.append('Server-Timing', get_server_timing(stats))
+    route = f'{request.method} {get_route_path(request.app, request.scope)}'
+    route_stats.setdefault(route, RouteStats()).add(stats)
+    return response
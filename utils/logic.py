@@ -1,8 +1,17 @@
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from binascii import Error as BinasciiError
+
 import bcrypt
 
+from utils.config import BCRYPT_ROUNDS
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
 
 def hash_password(password: str):
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
 
 
 def check_password(password: str, hashed_password: str):
@@ -13,6 +22,30 @@ def equal_uuids(uuid1, uuid2):
     return str(uuid1).strip() == str(uuid2).strip()
 
 
+def validate_limit(limit: int):
+    if limit < 1 or limit > MAX_PAGE_LIMIT:
+        raise ValueError(f'Invalid limit. Should be an integer from 1 to {MAX_PAGE_LIMIT}.')
+
+
+def encode_cursor(values: list) -> str:
+    """
+    Function that packs the ordering values of the last row of a page into an opaque cursor.
+    :param values: values of the ordering columns
+    :return: cursor token
+    """
+    return urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (BinasciiError, UnicodeError, json.JSONDecodeError):
+        raise ValueError('Invalid cursor.')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor.')
+    return values
+
+
 if __name__ == '__main__':
     p = input().strip()
     print(hash_password(p))
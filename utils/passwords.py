@@ -0,0 +1,47 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Lock
+
+from utils.config import BCRYPT_WORKERS, BCRYPT_QUEUE_SIZE
+from utils.exceptions import OverloadedError
+from utils.logic import hash_password, check_password
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a bounded queue. When all workers are busy and the queue is full, new jobs are rejected
+    with OverloadedError instead of waiting, so that a flood of expensive jobs does not slow down everything else.
+    """
+
+    def __init__(self, workers: int, queue_size: int, name: str):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.capacity = workers + queue_size
+        self.pending = 0
+        self.lock = Lock()
+
+    async def run(self, func, *args):
+        with self.lock:
+            if self.pending >= self.capacity:
+                raise OverloadedError
+            self.pending += 1
+
+        # Место освобождается, когда поток закончил работу, даже если запрос уже отменён
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future: Future):
+        with self.lock:
+            self.pending -= 1
+
+
+# bcrypt отпускает GIL, поэтому потоков достаточно, чтобы не блокировать event loop
+password_executor = BoundedExecutor(BCRYPT_WORKERS, BCRYPT_QUEUE_SIZE, 'bcrypt')
+
+
+async def hash_password_async(password: str) -> str:
+    return await password_executor.run(hash_password, password)
+
+
+async def check_password_async(password: str, hashed_password: str) -> bool:
+    return await password_executor.run(check_password, password, hashed_password)
@@ -0,0 +1,6 @@
+from redis import asyncio as aioredis
+
+from utils.config import REDIS_URL
+
+# Соединение устанавливается лениво, при первой команде
+redis = aioredis.from_url(REDIS_URL, encoding='utf8', decode_responses=False)
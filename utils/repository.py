@@ -1,9 +1,115 @@
 from abc import ABC, abstractmethod
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterable, Callable
 from uuid import UUID
 
-from sqlalchemy import insert, select, update, delete, and_
+from sqlalchemy import insert, select, update, delete, inspect, tuple_, literal, bindparam
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from utils.logic import encode_cursor, decode_cursor
+
+STATEMENT_CACHE_SIZE = 512
+BULK_CHUNK_SIZE = 1000
+# asyncpg не принимает больше 32767 параметров в одном запросе
+MAX_BIND_PARAMS = 32767
+
+# Оператор фильтра -> (число аргументов, построитель условия)
+FILTER_OPERATORS = {
+    'eq': (1, lambda column, params: column == params[0]),
+    'ne': (1, lambda column, params: column != params[0]),
+    'gt': (1, lambda column, params: column > params[0]),
+    'gte': (1, lambda column, params: column >= params[0]),
+    'lt': (1, lambda column, params: column < params[0]),
+    'lte': (1, lambda column, params: column <= params[0]),
+    'between': (2, lambda column, params: column.between(params[0], params[1])),
+    'in': (1, lambda column, params: column.in_(params[0])),
+    'prefix': (1, lambda column, params: column.like(params[0], escape='\\')),
+    'null': (0, lambda column, params: column.is_(None))
+}
+
+
+def chunked(data: list, columns_count: int = 1):
+    """
+    Function that splits rows into chunks small enough for one multi-row statement.
+    :param data: rows
+    :param columns_count: number of bind parameters per row
+    :return: iterator of chunks
+    """
+    chunk_size = max(1, min(BULK_CHUNK_SIZE, MAX_BIND_PARAMS // max(1, columns_count)))
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+def get_column(model, name: str):
+    column = model.__table__.columns.get(name)
+    if column is None:
+        raise ValueError(f'Unknown column "{name}".')
+    return column
+
+
+def parse_filters(filter_dict: dict | None, filter_by: dict) -> tuple[tuple, dict]:
+    """
+    Function that splits filters into a statement shape and bind parameters.
+    Filters with the same columns and operators share one shape, so the statement is built and compiled once.
+    :param filter_dict: dict {column: (operator, *args)}, e.g. {'price': ('gte', 10)} or {'uuid': ('in', uuids)}
+    :param filter_by: dict {column: value} of equality filters
+    :return: (shape, params)
+    """
+    conditions = [(name, ('eq', value)) for name, value in filter_by.items()]
+    conditions.extend((filter_dict or dict()).items())
+
+    shape, params = list(), dict()
+    for i, (name, condition) in enumerate(conditions):
+        operator, *args = condition
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f'Unknown filter operator "{operator}".')
+        if operator == 'eq' and args == [None]:
+            operator, args = 'null', list()
+        if len(args) != FILTER_OPERATORS[operator][0]:
+            raise ValueError(f'Invalid filter for "{name}". Operator "{operator}" '
+                             f'takes {FILTER_OPERATORS[operator][0]} arguments.')
+
+        if operator == 'in':
+            args = [list(args[0])]
+        elif operator == 'prefix':
+            args = [args[0].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%']
+        for j, arg in enumerate(args):
+            params[f'p{i}_{j}'] = arg
+        shape.append((name, operator))
+    return tuple(shape), params
+
+
+def get_filter_clauses(model, shape: tuple) -> list:
+    clauses = list()
+    for i, (name, operator) in enumerate(shape):
+        column = get_column(model, name)
+        arity, build = FILTER_OPERATORS[operator]
+        params = [bindparam(f'p{i}_{j}', type_=column.type, expanding=operator == 'in') for j in range(arity)]
+        clauses.append(build(column, params))
+    return clauses
+
+
+def get_order_clauses(model, order_by: tuple) -> list:
+    # Имя колонки с минусом означает сортировку по убыванию
+    return [get_column(model, name[1:]).desc() if name.startswith('-') else get_column(model, name).asc()
+            for name in order_by]
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def build_select(model, shape: tuple, order_by: tuple = (), columns: tuple | None = None):
+    if columns:
+        stmt = select(*[get_column(model, name) for name in columns])
+    else:
+        stmt = select(model)
+    return stmt.where(*get_filter_clauses(model, shape)).order_by(*get_order_clauses(model, order_by))
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def build_delete(model, shape: tuple):
+    return delete(model).where(*get_filter_clauses(model, shape))
+
 
 class AbstractRepository(ABC):
     @abstractmethod
@@ -44,28 +150,133 @@ class SQLAlchemyRepository(AbstractRepository):
         res = await session.execute(stmt)
         return res.scalar_one()
 
-    async def find_all(self, session, filter_dict: dict = None, **filter_by):
-        stmt = select(self.model).filter_by(**filter_by)
+    async def add_many(self, session, data: list[dict]):
+        """
+        Function that inserts rows with multi-row VALUES, one statement per chunk.
+        :param session: session
+        :param data: list of dicts with the same keys
+        """
+        for chunk in chunked(data, len(data[0]) if data else 1):
+            await session.execute(insert(self.model).values(chunk))
 
-        if filter_dict:
-            for key, val in filter_dict.items():
-                if key in self.model.__dict__:
-                    if val[0] == 'between':
-                        stmt = stmt.filter(and_(self.model.__dict__[key] >= val[1],
-                                                self.model.__dict__[key] <= val[2]))
+    async def upsert_many(self, session, data: list[dict], index_elements: Iterable[str] | None = None,
+                          set_: Callable | None = None):
+        """
+        Function that inserts rows or updates the existing ones, one INSERT ... ON CONFLICT statement per chunk.
+        :param session: session
+        :param data: list of dicts with the same keys
+        :param index_elements: names of the conflict key columns, the primary key by default
+        :param set_: function that takes the excluded row and returns the SET clause,
+                     by default all given columns except the conflict key are overwritten
+        """
+        if index_elements is None:
+            index_elements = [column.name for column in inspect(self.model).primary_key]
+        index_elements = list(index_elements)
 
-        res = await session.execute(stmt)
-        res = [row[0].to_read_model() for row in res.all()]
-        return res
+        for chunk in chunked(data, len(data[0]) if data else 1):
+            stmt = postgresql.insert(self.model).values(chunk)
+            if set_ is not None:
+                set_clause = set_(stmt.excluded)
+            else:
+                set_clause = {name: stmt.excluded[name] for name in chunk[0] if name not in index_elements}
+
+            if set_clause:
+                stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=set_clause)
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+            await session.execute(stmt)
+
+    async def edit_many(self, session, data: list[dict]):
+        """
+        Function that updates rows by primary key with executemany, one round trip per chunk.
+        :param session: session
+        :param data: list of dicts, each one contains the primary key and the columns to update
+        """
+        mapper = inspect(self.model)
+        for chunk in chunked(data):
+            await session.execute(update(self.model), chunk)
+            # Массовое обновление по ключу не трогает identity map, поэтому загруженные объекты помечаются устаревшими
+            for item in chunk:
+                identity_key = mapper.identity_key_from_primary_key([item[column.name]
+                                                                     for column in mapper.primary_key])
+                instance = session.identity_map.get(identity_key)
+                if instance is not None:
+                    session.expire(instance)
+
+    async def delete_many(self, session, uuids: Iterable[UUID]) -> int:
+        """
+        Function that deletes rows by uuid, one statement per chunk.
+        :return: number of deleted rows
+        """
+        deleted = 0
+        for chunk in chunked(list(uuids)):
+            res = await self.delete_all(session, {'uuid': ('in', chunk)})
+            deleted += res.rowcount
+        return deleted
+
+    async def find_all(self, session, filter_dict: dict = None, order_by: Iterable[str] = (), **filter_by):
+        res = await self._select(session, filter_dict, filter_by, order_by)
+        return [row.to_read_model() for row in res.scalars().all()]
 
     async def find_one(self, session, filter_dict: dict = None, **filter_by):
-        stmt = select(self.model).filter_by(**filter_by).limit(2)
-        res = await session.execute(stmt)
-        res = [row[0].to_read_model() for row in res.all()]
-        if res:
-            return res[0]
-        else:
-            return None
+        # Поиск по первичному ключу идёт через identity map, повторно в рамках сессии запись не загружается
+        primary_key = inspect(self.model).primary_key
+        if not filter_dict and len(primary_key) == 1 and filter_by.keys() == {primary_key[0].name}:
+            res = await session.get(self.model, filter_by[primary_key[0].name])
+            return res.to_read_model() if res else None
+
+        res = await self._select(session, filter_dict, filter_by, limit=2)
+        res = res.scalars().first()
+        return res.to_read_model() if res else None
+
+    async def find_page(self, session, limit: int, cursor: str | None = None, order_by: Iterable[str] = ('uuid',),
+                        columns: Iterable[str] | None = None, filter_dict: dict = None,
+                        **filter_by) -> tuple[list, str | None]:
+        """
+        Function that selects one page of rows using keyset pagination.
+        The primary key is appended to the ordering, so the order is stable and each page is an index range scan.
+        :param session: session
+        :param limit: max number of rows in the page
+        :param cursor: cursor returned with the previous page, None for the first page
+        :param order_by: names of the ordering columns
+        :param columns: names of the columns to select, None to select whole read models
+        :param filter_dict: filters in the format of parse_filters
+        :return: (rows, cursor of the next page or None if this page is the last one)
+        """
+        order_by = list(order_by)
+        for column in inspect(self.model).primary_key:
+            if column.name not in order_by:
+                order_by.append(column.name)
+        order_columns = [get_column(self.model, name) for name in order_by]
+        if columns:
+            columns = list(columns)
+
+        shape, params = parse_filters(filter_dict, filter_by)
+        stmt = build_select(self.model, shape, tuple(order_by),
+                            tuple(dict.fromkeys(columns + order_by)) if columns else None)
+
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != len(order_columns):
+                raise ValueError('Invalid cursor.')
+            stmt = stmt.where(tuple_(*order_columns) > tuple_(*[
+                literal(self._parse_cursor_value(column, value), column.type)
+                for column, value in zip(order_columns, values)
+            ]))
+
+        # Лишняя строка показывает, есть ли следующая страница
+        res = await session.execute(stmt.limit(limit + 1), params)
+        rows = [row._asdict() for row in res.all()] if columns else res.scalars().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([last[name] if columns else getattr(last, name) for name in order_by])
+
+        if columns:
+            return [{name: row[name] for name in columns} for row in rows], next_cursor
+        return [row.to_read_model() for row in rows], next_cursor
 
     async def delete_one(self, session, uuid: UUID):
         stmt = delete(self.model).where(self.model.uuid == uuid).returning(self.model.uuid)
@@ -73,6 +284,26 @@ class SQLAlchemyRepository(AbstractRepository):
         return res
 
     async def delete_all(self, session, filter_dict: dict = None, **filter_by):
-        stmt = delete(self.model).filter_by(**filter_by)
-        res = await session.execute(stmt)
+        shape, params = parse_filters(filter_dict, filter_by)
+        res = await session.execute(build_delete(self.model, shape), params)
         return res
+
+    async def _select(self, session, filter_dict: dict | None, filter_by: dict, order_by: Iterable[str] = (),
+                      limit: int | None = None):
+        shape, params = parse_filters(filter_dict, filter_by)
+        stmt = build_select(self.model, shape, tuple(order_by))
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return await session.execute(stmt, params)
+
+    @staticmethod
+    def _parse_cursor_value(column, value):
+        if value is None:
+            raise ValueError('Invalid cursor.')
+        try:
+            python_type = column.type.python_type
+            if python_type is datetime:
+                return datetime.fromisoformat(value)
+            return python_type(value)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor.')
@@ -0,0 +1,9 @@
+import msgpack
+from fastapi.responses import Response
+
+
+class MsgPackResponse(Response):
+    media_type = 'application/msgpack'
+
+    def render(self, content) -> bytes:
+        return msgpack.packb(content)
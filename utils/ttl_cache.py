@@ -0,0 +1,35 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache whose entries expire after ttl seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= monotonic():
+            del self.entries[key]
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value):
+        self.entries[key] = (monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def evict(self, predicate: Callable[[Hashable], bool]):
+        for key in [key for key in self.entries if predicate(key)]:
+            del self.entries[key]
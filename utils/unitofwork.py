@@ -1,6 +1,10 @@
+import asyncio
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
 
-from utils.database import async_session_maker
+from sqlalchemy.exc import DBAPIError
+
+from utils.database import async_session_maker, engine, replica_router
 
 
 class IUnitOfWork(ABC):
@@ -25,20 +29,95 @@ class IUnitOfWork(ABC):
     async def rollback(self):
         ...
 
+    @abstractmethod
+    def transaction(self):
+        ...
+
+    @abstractmethod
+    async def pin_primary(self):
+        ...
+
 
 class UnitOfWork(IUnitOfWork):
-    def __init__(self):
+    """
+    Unit of work shared by all services of one request.
+    Nested enters reuse the same session, which is closed when the outermost block exits.
+    A read-only unit of work reads from a replica, if replicas are configured and healthy.
+    """
+
+    def __init__(self, read_only: bool = False):
         self.session_factory = async_session_maker
+        self.read_only = read_only
+        self.session = None
+        self.depth = 0
+        self.transaction_depth = 0
 
     async def __aenter__(self):
-        self.session = self.session_factory()
+        if self.session is None:
+            self.session = await self._open_session()
+        self.depth += 1
+        return self
 
-    async def __aexit__(self, *args):
-        # await self.rollback()
-        await self.session.close()
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.depth -= 1
+        try:
+            # Внутри transaction() откат выполняет сама транзакция
+            if exc_type is not None and not self.transaction_depth:
+                await self.rollback()
+        finally:
+            if not self.depth:
+                session, self.session = self.session, None
+                await session.close()
+
+    async def pin_primary(self):
+        """
+        Function that switches the unit of work to the primary, e.g. for reads that must see the latest writes.
+        """
+        self.read_only = False
+        if self.session is not None and self.session.bind is not engine:
+            # На реплике не бывает незакоммиченных изменений, поэтому сессию можно просто заменить
+            await self.session.close()
+            self.session = self.session_factory()
+
+    async def _open_session(self):
+        if self.read_only:
+            replica_engine = replica_router.get_engine()
+            while replica_engine is not None:
+                session = self.session_factory(bind=replica_engine)
+                try:
+                    # Проверка доступности: соединение берётся сразу, битые соединения отсекает pre-ping пула
+                    await session.connection()
+                except (DBAPIError, OSError, asyncio.TimeoutError):
+                    # asyncio.TimeoutError (таймаут подключения) до Python 3.11 не наследуется от OSError
+                    await session.close()
+                    replica_router.mark_failed(replica_engine)
+                    replica_engine = replica_router.get_engine()
+                else:
+                    return session
+        return self.session_factory()
 
     async def commit(self):
-        await self.session.commit()
+        # Внутри transaction() сервисы только сбрасывают изменения, коммит делает внешний блок
+        if self.transaction_depth:
+            await self.session.flush()
+        else:
+            await self.session.commit()
 
     async def rollback(self):
         await self.session.rollback()
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Context manager that runs several service calls in one database transaction.
+        """
+        async with self:
+            self.transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.transaction_depth -= 1
+                await self.rollback()
+                raise
+            self.transaction_depth -= 1
+            await self.commit()